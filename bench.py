@@ -0,0 +1,315 @@
+""" Benchmark of the data processing pipeline and of the plots, run on synthetic race data.
+
+Usage: python -m bench [--races N] [--points N] [--interval-sec S] [--workers N] [--athletes N] [--output FILE]
+       python -m bench --csv-only [--races N] [--output FILE]
+"""
+from config import config
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+
+# Official distances (km) of the synthetic races
+SYNTHETIC_RACE_DISTANCES_KM = (5, 6, 10, 21.0975, 42.195)
+
+GPX_HEADER = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+              '<gpx creator="bench" version="1.1" xmlns="http://www.topografix.com/GPX/1/1">\n'
+              ' <trk>\n'
+              '  <name>{name}</name>\n'
+              '  <type>running</type>\n'
+              '  <trkseg>\n')
+GPX_POINT = ('   <trkpt lat="{lat:.7f}" lon="{lon:.7f}">\n'
+             '    <ele>{elev:.1f}</ele>\n'
+             '    <time>{time}</time>\n'
+             '   </trkpt>\n')
+GPX_FOOTER = ('  </trkseg>\n'
+              ' </trk>\n'
+              '</gpx>\n')
+
+
+def generate_gpx_file(filepath, rng, start_time, points_count, interval_sec):
+    """ Write a .GPX file with a random running route (about 3 m/s, smoothly changing heading and elevation) """
+
+    heading = np.cumsum(rng.normal(0, 0.15, points_count))
+    step_m = rng.normal(3.0, 0.3, points_count) * interval_sec
+    lat = 41.4 + rng.uniform(-1, 1) + np.cumsum(step_m * np.cos(heading)) / 111_320
+    lon = 2.2 + rng.uniform(-1, 1) + np.cumsum(step_m * np.sin(heading)) / (111_320 * np.cos(np.radians(41.4)))
+    elev = 50 + np.cumsum(rng.normal(0, 0.2, points_count))
+    timestamps = [(start_time + timedelta(seconds=idx * interval_sec)).strftime("%Y-%m-%dT%H:%M:%SZ")
+                  for idx in range(points_count)]
+
+    with open(filepath, "w") as gpx_file:
+        gpx_file.write(GPX_HEADER.format(name=os.path.basename(filepath)))
+        gpx_file.writelines(GPX_POINT.format(lat=lat[idx], lon=lon[idx], elev=elev[idx], time=timestamps[idx])
+                            for idx in range(points_count))
+        gpx_file.write(GPX_FOOTER)
+
+
+def generate_dataset(dirpath, races_count, points_count, interval_sec, seed=0):
+    """ Generate a race results .CSV file and the .GPX files of the races in the given folder. Return the paths of the
+    .CSV file and of the .GPX folder """
+
+    rng = np.random.default_rng(seed)
+    gpx_dirpath = os.path.join(dirpath, "race_data") + os.sep
+    os.makedirs(gpx_dirpath, exist_ok=True)
+
+    rows = []
+    for idx_race in range(races_count):
+        row, date = generate_race_row(rng, idx_race)
+        generate_gpx_file(gpx_dirpath + row["gpxfilename"], rng, date + timedelta(hours=9), points_count, interval_sec)
+        rows.append(row)
+
+    csv_filepath = os.path.join(dirpath, "race_results.csv")
+    pd.DataFrame(rows).to_csv(csv_filepath, index=False)
+    return csv_filepath, gpx_dirpath
+
+
+def generate_race_row(rng, idx_race):
+    """ Return a random row of the race results .CSV file and the date of the race """
+
+    distance = rng.choice(SYNTHETIC_RACE_DISTANCES_KM)
+    date = datetime(2015, 1, 1) + timedelta(days=int(rng.integers(0, 3650)))
+    duration_sec = int(distance * rng.uniform(240, 420))
+    pace_sec = int(duration_sec / distance)
+    row = {"name": f"Race {idx_race}",
+           "distance": distance,
+           "date": date.strftime("%Y-%m-%d"),
+           "city": "City",
+           "country": "Country",
+           "duration": f"{duration_sec // 3600}:{duration_sec // 60 % 60:02d}:{duration_sec % 60:02d}",
+           "pace": f"{pace_sec // 3600:02d}:{pace_sec // 60 % 60:02d}:{pace_sec % 60:02d}",
+           "gpxfilename": f"race_{idx_race:05d}.gpx"}
+    return row, date
+
+
+def generate_race_results_csv(filepath, races_count, seed=0):
+    """ Write a race results .CSV file with random races, without generating their .GPX files """
+
+    rng = np.random.default_rng(seed)
+    pd.DataFrame([generate_race_row(rng, idx_race)[0] for idx_race in range(races_count)]).to_csv(filepath,
+                                                                                                  index=False)
+
+
+def from_str_to_timedelta(row, column_name):
+    """ For a dataframe row containing the race data, convert the value from the
+    column with the name given from string into timedelta """
+
+    duration = datetime.strptime(row[column_name], "%H:%M:%S")
+    duration = timedelta(hours=duration.hour,
+                         minutes=duration.minute,
+                         seconds=duration.second)
+    return duration
+
+
+def process_date_data_apply(df):
+    """ Process the data from the "date" column row by row (implementation preceding the vectorized
+    process_date_data, kept as baseline of the CSV benchmark and as reference for the tests) """
+
+    df["date_str"] = df.apply(lambda row: row["date"].strftime("%b %d, %Y"), axis=1)
+
+    return df
+
+
+def process_duration_data_apply(df):
+    """ Process the data from the "duration" column row by row (implementation preceding the vectorized
+    process_duration_data, kept as baseline of the CSV benchmark and as reference for the tests) """
+
+    df = df.rename(columns={"duration": "duration_total_timedelta"})
+    df["duration_total_timedelta"] = df.apply(func=from_str_to_timedelta,
+                                              args=("duration_total_timedelta",),
+                                              axis=1)
+
+    df["duration_total_sec"] = df.apply(lambda row: row["duration_total_timedelta"].seconds, axis=1)
+
+    df["duration_km_timedelta"] = df["duration_total_timedelta"] / df["distance"]
+
+    df["duration_km_timedelta_str"] = df.apply(lambda row: datetime.strftime(datetime(2025, 1, 1) +
+                                                                             row["duration_km_timedelta"], "%H:%M:%S"),
+                                               axis=1)
+
+    df["duration_km_sec"] = df["duration_total_sec"] / df["distance"]
+
+    df = df.rename(columns={"pace": "pace_average_official_timedelta_str"})
+    df["pace_average_official_timedelta"] = df.apply(func=from_str_to_timedelta,
+                                                     args=("pace_average_official_timedelta_str",),
+                                                     axis=1)
+    df["pace_average_official_sec"] = df.apply(lambda row: int(row["pace_average_official_timedelta"].total_seconds()),
+                                               axis=1)
+
+    return df
+
+
+def generate_athletes(dirpath, csv_filepath, gpx_dirpath, athletes_count):
+    """ Build the athletes of the benchmark: each one has a copy of the same .CSV file and .GPX files (i.e. identical
+    routes, as for the members of a club running the same races) """
+
+    athletes = [{"name": "Athlete 0",
+                 "csv_race_results_filepath": csv_filepath,
+                 "gpx_race_route_filepath": gpx_dirpath}]
+    for idx_athlete in range(1, athletes_count):
+        athlete_dirpath = os.path.join(dirpath, f"athlete_{idx_athlete}")
+        shutil.copytree(gpx_dirpath, os.path.join(athlete_dirpath, "race_data"))
+        shutil.copy(csv_filepath, athlete_dirpath)
+        athletes.append({"name": f"Athlete {idx_athlete}",
+                         "csv_race_results_filepath": os.path.join(athlete_dirpath, os.path.basename(csv_filepath)),
+                         "gpx_race_route_filepath": os.path.join(athlete_dirpath, "race_data") + os.sep})
+    return athletes
+
+
+def run_stage(results, stage_name, func, *args):
+    """ Run a stage of the benchmark, record its duration and peak memory and return its result. The stage is run a
+    second time for measuring the memory, since tracing the allocations slows it down """
+
+    time_start = time.perf_counter()
+    result = func(*args)
+    duration_sec = time.perf_counter() - time_start
+
+    tracemalloc.start()
+    func(*args)
+    _, peak_memory_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    results.append({"stage": stage_name,
+                    "duration_sec": duration_sec,
+                    "peak_memory_bytes": peak_memory_bytes})
+    print(f"{stage_name:<45} {duration_sec:9.3f} s {peak_memory_bytes / 2 ** 20:9.1f} MB", file=sys.stderr)
+    return result
+
+
+def get_git_commit():
+    """ Return the hash of the current git commit, or None if it is not available """
+
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(races_count, points_count, interval_sec, workers, athletes_count=1, seed=0):
+    """ Generate a synthetic dataset, run the whole pipeline and all the plots on it and return the results """
+
+    # Imported here, since they read the configuration when they are used
+    from data_processing import (process_date_data, process_duration_data, parse_gpx_file, add_route_data,
+                                 add_dist_and_time_accumulative_route_data, add_pace_data)
+    from dataset_store import read_race_results
+    from race_aggregation import aggregate_time_per_km, count_races_per_distance
+    from plotting import (plot_time_per_km, plot_time_per_km_aggregated, plot_number_of_races,
+                          plot_number_of_races_aggregated, plot_starting_points, plot_route, plot_elevation, plot_pace)
+
+    with tempfile.TemporaryDirectory() as dirpath:
+        csv_filepath, gpx_dirpath = generate_dataset(dirpath, races_count, points_count, interval_sec, seed)
+        athletes = generate_athletes(dirpath, csv_filepath, gpx_dirpath, athletes_count)
+
+        # Run on the synthetic data, without the caches (which would hide the processing costs)
+        config.update({"athletes": athletes,
+                       "route_loading_workers": workers,
+                       "route_cache_dirpath": None,
+                       "dataset_dirpath": None})
+
+        stages = []
+        df = run_stage(stages, "read_race_results", read_race_results)
+        df = run_stage(stages, "process_date_data", process_date_data, df)
+        df = run_stage(stages, "process_duration_data", process_duration_data, df)
+        run_stage(stages, "parse_gpx_file",
+                  lambda: [parse_gpx_file(gpx_filepath) for gpx_filepath in df["gpx_filepath"]])
+        df, route_store = run_stage(stages, "add_route_data", add_route_data, df)
+        df = run_stage(stages, "add_dist_and_time_accumulative_route_data",
+                       add_dist_and_time_accumulative_route_data, df, route_store)
+        df, pace_store = run_stage(stages, "add_pace_data", add_pace_data, df, route_store)
+
+        race_index = df.index[0]
+        run_stage(stages, "plot_time_per_km", plot_time_per_km, df, "All")
+        run_stage(stages, "plot_number_of_races", plot_number_of_races, df)
+        aggregates = run_stage(stages, "aggregate_time_per_km", aggregate_time_per_km, df, "All", "Month")
+        run_stage(stages, "plot_time_per_km_aggregated", plot_time_per_km_aggregated, aggregates)
+        distance_counts = run_stage(stages, "count_races_per_distance", count_races_per_distance, df)
+        run_stage(stages, "plot_number_of_races_aggregated", plot_number_of_races_aggregated, distance_counts)
+        run_stage(stages, "plot_starting_points", plot_starting_points, df, route_store)
+        run_stage(stages, "plot_route", plot_route, df, route_store, race_index)
+        run_stage(stages, "plot_elevation", plot_elevation, df, route_store, race_index)
+        run_stage(stages, "plot_pace", plot_pace, df, pace_store, race_index)
+
+    return {"git_commit": get_git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "parameters": {"races": races_count,
+                           "points_per_race": points_count,
+                           "interval_sec": interval_sec,
+                           "workers": workers,
+                           "athletes": athletes_count,
+                           "seed": seed},
+            "route_points_total": int(route_store.lengths.sum()),
+            "route_points_stored": int(route_store.offsets[-1]),
+            "stages": stages}
+
+
+def run_csv_benchmark(races_count, seed=0):
+    """ Generate a synthetic race results .CSV file (without .GPX files) and compare the row by row and the vectorized
+    processing of its date and duration columns. Return the results """
+
+    # Imported here, since they read the configuration when they are used
+    from data_processing import process_date_data, process_duration_data
+    from dataset_store import read_athlete_race_results
+
+    with tempfile.TemporaryDirectory() as dirpath:
+        csv_filepath = os.path.join(dirpath, "race_results.csv")
+        generate_race_results_csv(csv_filepath, races_count, seed)
+
+        stages = []
+        df = run_stage(stages, "read_athlete_race_results", read_athlete_race_results,
+                       {"name": "", "csv_race_results_filepath": csv_filepath, "gpx_race_route_filepath": ""})
+        apply_df = run_stage(stages, "process_date_data_apply", lambda: process_date_data_apply(df.copy()))
+        apply_df = run_stage(stages, "process_duration_data_apply", process_duration_data_apply, apply_df)
+        vectorized_df = run_stage(stages, "process_date_data", lambda: process_date_data(df.copy()))
+        vectorized_df = run_stage(stages, "process_duration_data", process_duration_data, vectorized_df)
+
+    return {"git_commit": get_git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "parameters": {"races": races_count,
+                           "csv_only": True,
+                           "seed": seed},
+            "results_equal": bool(apply_df.equals(vectorized_df)),
+            "stages": stages}
+
+
+def main():
+    """ Parse the command line arguments, run the benchmark and output the results as JSON """
+
+    parser = argparse.ArgumentParser(description="Benchmark the data processing pipeline and the plots on "
+                                                 "synthetic race data")
+    parser.add_argument("--races", type=int,
+                        help="number of synthetic races (by default, 100, or 100000 with --csv-only)")
+    parser.add_argument("--points", type=int, default=3600, help="number of route points per race")
+    parser.add_argument("--interval-sec", type=int, default=1, help="seconds between consecutive route points")
+    parser.add_argument("--workers", type=int, default=1, help="number of processes used for loading the routes")
+    parser.add_argument("--athletes", type=int, default=1,
+                        help="number of athletes, all having the same races and .GPX files")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic data generator")
+    parser.add_argument("--csv-only", action="store_true",
+                        help="only compare the row by row and the vectorized processing of the .CSV date and duration "
+                             "columns, without generating any .GPX file")
+    parser.add_argument("--output", help="path of the JSON results file (printed to stdout if not given)")
+    args = parser.parse_args()
+
+    if args.csv_only:
+        results = run_csv_benchmark(args.races or 100_000, args.seed)
+    else:
+        results = run_benchmark(args.races or 100, args.points, args.interval_sec, args.workers, args.athletes,
+                                args.seed)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+from profiling import profiled
+import numpy as np
+import pandas as pd
+
+
+@profiled
+def compute_best_efforts(route_store, distances_km):
+    """ Find, for every race and every given distance, the fastest contiguous part of the route covering exactly that
+    distance. Each window starts or ends at a route point, the time at its other end being interpolated between the
+    route points around it. The efforts are searched once per track and shared by the races of the track. Return a
+    dataframe with one row per race and distance (the races shorter than a distance have no row for it) """
+
+    dist_accum_km = route_store.column("dist_accum_km")
+    duration_accum_sec = route_store.column("duration_accum_sec").astype(np.float64)
+    dist_total_km = dist_accum_km[route_store.offsets[1:] - 1]
+    point_track_positions = route_store.row_tracks()
+
+    efforts = []
+    for distance_km in distances_km:
+        # Windows ending at a route point and windows starting at a route point
+        start_km = dist_accum_km - distance_km
+        end_km = dist_accum_km + distance_km
+        duration_ending_sec = duration_accum_sec - route_store.interpolate("duration_accum_sec", "dist_accum_km",
+                                                                           point_track_positions, start_km)
+        duration_starting_sec = route_store.interpolate("duration_accum_sec", "dist_accum_km", point_track_positions,
+                                                        end_km) - duration_accum_sec
+        duration_ending_sec[start_km < 0] = np.inf
+        duration_starting_sec[end_km > dist_total_km[point_track_positions]] = np.inf
+
+        is_ending = duration_ending_sec <= duration_starting_sec
+        duration_sec = np.where(is_ending, duration_ending_sec, duration_starting_sec)
+        window_start_km = np.where(is_ending, start_km, dist_accum_km)
+
+        # Fastest window of each track: the first point of each track once sorted by track and duration, then
+        # expanded to the races of the track
+        order = np.lexsort((duration_sec, point_track_positions))
+        best_idx = order[route_store.offsets[:-1]][route_store.race_tracks]
+        is_covered = np.isfinite(duration_sec[best_idx])
+
+        efforts.append(pd.DataFrame({"race_id": route_store.race_ids[is_covered],
+                                     "distance_km": distance_km,
+                                     "duration_sec": duration_sec[best_idx][is_covered],
+                                     "start_km": window_start_km[best_idx][is_covered]}))
+
+    efforts = pd.concat(efforts, ignore_index=True) if efforts else pd.DataFrame(
+        columns=["race_id", "distance_km", "duration_sec", "start_km"])
+    efforts["pace_sec"] = efforts["duration_sec"] / efforts["distance_km"]
+
+    return efforts
+
+
+def get_personal_bests(efforts):
+    """ Return the fastest effort of all the races for each distance """
+
+    return efforts.loc[efforts.groupby("distance_km")["duration_sec"].idxmin()].sort_values("distance_km")
@@ -1,59 +1,119 @@
 from config import config
-from datetime import datetime, timedelta
+from route_cache import (load_cached_route, store_cached_route, enforce_cache_size_limit, load_track_id_index,
+                         store_track_id_index)
+from route_store import RouteStore
+from route_simplification import compute_rdp_importance
+from profiling import profiled
 import numpy as np
-import gpxpy
-import haversine
-import math
-
-
-def from_str_to_timedelta(row, column_name):
-    """ For a dataframe row containing the race data, convert the value from the
-    column with the name given from string into timedelta """
-
-    duration = datetime.strptime(row[column_name], "%H:%M:%S")
-    duration = timedelta(hours=duration.hour,
-                         minutes=duration.minute,
-                         seconds=duration.second)
-    return duration
-
-
+import pandas as pd
+import hashlib
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from xml.etree.ElementTree import iterparse, ParseError
+
+
+# Layout of the array holding the points of a route together with their derived metrics. The step values and the
+# distance percentage are not stored, since they are cheap to derive from the cumulative values when needed. The
+# Ramer-Douglas-Peucker importance is used for selecting the level of detail of the plotted route
+ROUTE_POINT_DTYPE = np.dtype([("lat", np.float64),
+                              ("lon", np.float64),
+                              ("elev", np.float64),
+                              ("timestamp", "datetime64[us]"),
+                              ("dist_accum_km", np.float64),
+                              ("duration_accum_sec", np.int64),
+                              ("rdp_importance_m", np.float32)])
+
+# Predefined lengths of the splits used for calculating the pace
+SPLIT_LENGTHS_KM = {"1 km": 1.0,
+                    "500 m": 0.5,
+                    "1 mile": 1.609344}
+
+
+@profiled
 def process_date_data(df):
     """ Process the data from the "date" column """
 
-    df["date_str"] = df.apply(lambda row: row["date"].strftime("%b %d, %Y"), axis=1)
+    df["date_str"] = df["date"].dt.strftime("%b %d, %Y")
 
     return df
 
 
+@profiled
 def process_duration_data(df):
     """ Process the data from the "duration" column """
 
     df = df.rename(columns={"duration": "duration_total_timedelta"})
-    df["duration_total_timedelta"] = df.apply(func=from_str_to_timedelta,
-                                              args=("duration_total_timedelta",),
-                                              axis=1)
+    df["duration_total_timedelta"] = pd.to_timedelta(df["duration_total_timedelta"])
 
-    df["duration_total_sec"] = df.apply(lambda row: row["duration_total_timedelta"].seconds, axis=1)
+    df["duration_total_sec"] = df["duration_total_timedelta"].dt.seconds.astype(np.int64)
 
     df["duration_km_timedelta"] = df["duration_total_timedelta"] / df["distance"]
 
-    df["duration_km_timedelta_str"] = df.apply(lambda row: datetime.strftime(datetime(2025, 1, 1) +
-                                                                             row["duration_km_timedelta"], "%H:%M:%S"),
-                                               axis=1)
+    df["duration_km_timedelta_str"] = format_duration_sec(
+        df["duration_km_timedelta"].dt.floor("s").dt.total_seconds())
 
     df["duration_km_sec"] = df["duration_total_sec"] / df["distance"]
 
     df = df.rename(columns={"pace": "pace_average_official_timedelta_str"})
-    df["pace_average_official_timedelta"] = df.apply(func=from_str_to_timedelta,
-                                                     args=("pace_average_official_timedelta_str",),
-                                                     axis=1)
-    df["pace_average_official_sec"] = df.apply(lambda row: int(row["pace_average_official_timedelta"].total_seconds()), axis=1)
+    df["pace_average_official_timedelta"] = pd.to_timedelta(df["pace_average_official_timedelta_str"])
+    df["pace_average_official_sec"] = df["pace_average_official_timedelta"].dt.total_seconds().astype(np.int64)
 
     return df
 
 
-def parse_gpx_file(filepath):
-    """ Parse a .GPX file and return 4 lists with latitude, longitude, elevation and timestamp values, respectively """
+def get_xml_local_name(tag):
+    """ Return the name of an XML tag without its namespace """
+
+    return tag.rpartition("}")[2]
+
+
+def parse_gpx_file_iterparse(filepath):
+    """ Parse a .GPX file by streaming its track points with an incremental XML parser and return 4 arrays with
+    latitude, longitude, elevation and timestamp values, respectively """
+
+    lat = array("d")
+    lon = array("d")
+    elev = array("d")
+    timestamp = []
+
+    for _, element in iterparse(filepath, events=("end",)):
+        tag = get_xml_local_name(element.tag)
+        if tag == "trkpt":
+            lat.append(float(element.get("lat")))
+            lon.append(float(element.get("lon")))
+            point_elev = float("nan")
+            point_time = "NaT"
+            for child in element:
+                child_tag = get_xml_local_name(child.tag)
+                if child_tag == "ele" and child.text:
+                    point_elev = float(child.text)
+                elif child_tag == "time" and child.text:
+                    point_time = child.text.strip()
+                    if not point_time.endswith("Z"):
+                        # Only UTC timestamps are handled here, the others are left to gpxpy
+                        raise ValueError(f"Unsupported timestamp format: {point_time}")
+                    point_time = point_time[:-1]
+            elev.append(point_elev)
+            timestamp.append(point_time)
+            element.clear()
+        elif tag == "trkseg":
+            element.clear()
+
+    return (np.frombuffer(lat, dtype=np.float64),
+            np.frombuffer(lon, dtype=np.float64),
+            np.frombuffer(elev, dtype=np.float64),
+            np.array(timestamp, dtype="datetime64[us]"))
+
+
+def parse_gpx_file_gpxpy(filepath):
+    """ Parse a .GPX file with gpxpy and return 4 arrays with latitude, longitude, elevation and timestamp values,
+    respectively """
+
+    # Imported here (as haversine in compute_route_metrics), so that the app started from an exported bundle does not
+    # load the .GPX processing dependencies
+    import gpxpy
+
     lat = []
     lon = []
     elev = []
@@ -69,119 +129,331 @@ def parse_gpx_file(filepath):
                     elev.append(point.elevation)
                     timestamp.append(point.time)
 
-    return lat, lon, elev, timestamp
+    return (np.array(lat, dtype=np.float64),
+            np.array(lon, dtype=np.float64),
+            np.array(elev, dtype=np.float64),
+            timestamps_to_datetime64(timestamp))
 
 
-def add_route_data(df):
-    """ Get the route data from the .GPX file and add it to the dataframe """
+def parse_gpx_file(filepath):
+    """ Parse a .GPX file with the parser backend selected in the configuration file and return 4 arrays with
+    latitude, longitude, elevation and timestamp values, respectively """
 
-    df["route_points_lat"] = None
-    df["route_points_lon"] = None
-    df["route_points_elev"] = None
-    df["route_points_timestamp"] = None
+    if config["gpx_parser"] == "iterparse":
+        try:
+            return parse_gpx_file_iterparse(filepath)
+        except (ParseError, ValueError, TypeError):
+            # Fall back to gpxpy for the files which cannot be handled by the streaming parser
+            pass
 
-    for idx_row, row in df.iterrows():
-        lat, lon, elev, timestamp = parse_gpx_file(config["gpx_race_route_filepath"] + row["gpxfilename"])
-        df.at[idx_row, "route_points_lat"] = np.array(lat)
-        df.at[idx_row, "route_points_lon"] = np.array(lon)
-        df.at[idx_row, "route_points_elev"] = np.array(elev)
-        df.at[idx_row, "route_points_timestamp"] = np.array(timestamp)
+    return parse_gpx_file_gpxpy(filepath)
 
-    return df
 
+def timestamps_to_datetime64(timestamp):
+    """ Convert an array of timestamps (datetime objects or datetime64 values) into a datetime64 array in UTC """
 
-def add_dist_and_time_accumulative_route_data(df):
-    """ Calculate the current and cumulative distance and time of the steps from the route data """
-
-    df["route_points_dist_step_km"] = None
-    df["route_points_dist_accum_km"] = None
-    df["route_points_duration_step_sec"] = None
-    df["route_points_duration_accum_sec"] = None
-    df["route_points_duration_accum_timedelta"] = None
-    df["route_points_duration_accum_timedelta_str"] = None
-    df["route_points_dist_accum_percentage"] = None
-
-    for idx_row, row in df.iterrows():
-        dist_step_km = [0]
-        duration_step_sec = [0]
-        for idx_point in range(1, len(row["route_points_lat"])):
-            dist_step_current_km = haversine.haversine(
-                (row["route_points_lat"][idx_point - 1], row["route_points_lon"][idx_point - 1]),
-                (row["route_points_lat"][idx_point], row["route_points_lon"][idx_point]))
-            duration_step_current_sec = (row["route_points_timestamp"][idx_point] -
-                                         row["route_points_timestamp"][idx_point - 1]).seconds
-
-            dist_step_km.append(dist_step_current_km)
-            duration_step_sec.append(duration_step_current_sec)
-
-        dist_accum_km = np.cumsum(dist_step_km)
-        calculate_dist_accum_percentage = np.vectorize(lambda elem: elem * 100 / dist_accum_km[-1])
-        dist_accum_percentage = calculate_dist_accum_percentage(dist_accum_km)
-
-        df.at[idx_row, "route_points_dist_step_km"] = np.array(dist_step_km)
-        df.at[idx_row, "route_points_dist_accum_km"] = dist_accum_km
-        df.at[idx_row, "route_points_duration_step_sec"] = np.array(duration_step_sec)
-        df.at[idx_row, "route_points_duration_accum_sec"] = np.cumsum(duration_step_sec)
-        df.at[idx_row, "route_points_duration_accum_timedelta"] = np.array(
-            [timedelta(seconds=elem.item()) for elem in df.at[idx_row, "route_points_duration_accum_sec"]])
-        df.at[idx_row, "route_points_duration_accum_timedelta_str"] = np.array(
-            [datetime.strftime(datetime(2025, 1, 1) + elem, "%H:%M:%S") for elem in df.at[idx_row, "route_points_duration_accum_timedelta"]])
-        df.at[idx_row, "route_points_dist_accum_percentage"] = dist_accum_percentage
+    timestamp = np.asarray(timestamp)
+    if np.issubdtype(timestamp.dtype, np.datetime64):
+        return timestamp.astype("datetime64[us]")
+
+    return pd.to_datetime(timestamp, utc=True).tz_convert(None).to_numpy().astype("datetime64[us]")
+
+
+def format_duration_sec(duration_sec):
+    """ Format an array of durations given in seconds as "HH:MM:SS" strings (wrapping around at 24 hours,
+    like strftime applied to a datetime) """
+
+    duration_sec = np.asarray(duration_sec, dtype=np.int64)
+    hours = (duration_sec // 3600) % 24
+    minutes = (duration_sec // 60) % 60
+    seconds = duration_sec % 60
+
+    duration_str = np.char.zfill(hours.astype(str), 2)
+    for value in (minutes, seconds):
+        duration_str = np.char.add(np.char.add(duration_str, ":"), np.char.zfill(value.astype(str), 2))
+    return duration_str
+
+
+def compute_route_metrics(lat, lon, timestamp):
+    """ Calculate, over whole arrays at once, the step and cumulative distance and duration of the route points """
+
+    import haversine
+
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    timestamp = timestamps_to_datetime64(timestamp)
+    if len(lat) < 2:
+        raise ValueError("The route contains less than 2 points")
+    if np.isnat(timestamp).any():
+        raise ValueError("The route contains points without a timestamp")
+    timestamp_us = timestamp.astype(np.int64)
+
+    dist_step_km = np.zeros(len(lat))
+    dist_step_km[1:] = haversine.haversine_vector(np.column_stack((lat[:-1], lon[:-1])),
+                                                  np.column_stack((lat[1:], lon[1:])))
+    # Same value as timedelta.seconds: whole seconds, wrapped to the [0, 1 day) interval
+    duration_step_sec = np.zeros(len(lat), dtype=np.int64)
+    duration_step_sec[1:] = (np.diff(timestamp_us) // 1_000_000) % 86400
+
+    dist_accum_km = np.cumsum(dist_step_km)
+    if not dist_accum_km[-1] > 0:
+        raise ValueError("The total distance of the route is zero")
+    duration_accum_sec = np.cumsum(duration_step_sec)
+
+    return {"dist_step_km": dist_step_km,
+            "dist_accum_km": dist_accum_km,
+            "duration_step_sec": duration_step_sec,
+            "duration_accum_sec": duration_accum_sec,
+            "dist_accum_percentage": dist_accum_km * 100 / dist_accum_km[-1]}
+
+
+def get_file_content_hash(filepath):
+    """ Return the hash of the contents of a file, identifying the identical .GPX files (e.g. the same race recorded
+    by several athletes) """
+
+    with open(filepath, "rb") as gpx_file:
+        return hashlib.file_digest(gpx_file, "sha1").hexdigest()
+
+
+def load_route(filepath, track_id):
+    """ Return the route array (points and derived metrics) of a .GPX file with the given content hash, from the route
+    cache if possible """
+
+    route = load_cached_route(track_id)
+    if route is None:
+        lat, lon, elev, timestamp = parse_gpx_file(filepath)
+        metrics = compute_route_metrics(lat, lon, timestamp)
+
+        route = np.empty(len(lat), dtype=ROUTE_POINT_DTYPE)
+        route["lat"] = lat
+        route["lon"] = lon
+        route["elev"] = elev
+        route["timestamp"] = timestamp
+        route["dist_accum_km"] = metrics["dist_accum_km"]
+        route["duration_accum_sec"] = metrics["duration_accum_sec"]
+        route["rdp_importance_m"] = compute_rdp_importance(lat, lon)
+
+        store_cached_route(track_id, route)
+
+    return route
+
+
+def load_route_or_error(filepath, track_id):
+    """ Return a tuple with the route array of a .GPX file and None, or with None and the error message if the file
+    cannot be loaded """
+
+    try:
+        return load_route(filepath, track_id), None
+    except Exception as error:
+        return None, f"{type(error).__name__}: {error}"
+
+
+@profiled
+def load_routes(filepaths):
+    """ Load the route arrays of several .GPX files, in parallel if configured so. The files with identical contents
+    are loaded only once and share the same route array. Return a list of (track id, route, error message) tuples in
+    the same order as the given file paths, the track id being the content hash of the file """
+
+    track_ids = []
+    read_errors = {}  # file path -> error message, for the files which cannot be read
+    track_id_index = load_track_id_index()
+    is_index_changed = False
+    for filepath in filepaths:
+        # The files are hashed only if their size or modification time changed since they were indexed
+        try:
+            file_stat = os.stat(filepath)
+            index_key = os.path.abspath(filepath)
+            index_entry = track_id_index.get(index_key)
+            if index_entry is None or index_entry[:2] != [file_stat.st_size, file_stat.st_mtime_ns]:
+                index_entry = [file_stat.st_size, file_stat.st_mtime_ns, get_file_content_hash(filepath)]
+                track_id_index[index_key] = index_entry
+                is_index_changed = True
+            track_ids.append(index_entry[2])
+        except OSError as error:
+            track_ids.append(None)
+            read_errors[filepath] = f"{type(error).__name__}: {error}"
+    if is_index_changed:
+        try:
+            store_track_id_index(track_id_index)
+        except OSError:
+            # The files are simply hashed again at the next start
+            pass
+
+    # The cached routes are read directly, only the remaining unique files are parsed by the worker processes
+    results = {}  # track id -> (route, error message)
+    missing = {}  # track id -> path of one of its files
+    for filepath, track_id in zip(filepaths, track_ids):
+        if track_id is None or track_id in results or track_id in missing:
+            continue
+        route = load_cached_route(track_id)
+        if route is None:
+            missing[track_id] = filepath
+        else:
+            results[track_id] = (route, None)
+
+    if config["route_loading_workers"] > 1 and len(missing) > 1:
+        with ProcessPoolExecutor(max_workers=min(config["route_loading_workers"], len(missing))) as executor:
+            missing_results = list(executor.map(load_route_or_error, missing.values(), missing.keys()))
+    else:
+        missing_results = [load_route_or_error(filepath, track_id) for track_id, filepath in missing.items()]
+    results.update(zip(missing.keys(), missing_results))
+    if missing:
+        # Checked once for the whole batch, as it scans the whole cache folder
+        enforce_cache_size_limit()
+
+    return [(None, None, read_errors[filepath]) if track_id is None else (track_id, *results[track_id])
+            for filepath, track_id in zip(filepaths, track_ids)]
+
+
+@profiled
+def add_route_data(df):
+    """ Get the route data (points and derived metrics) from the .GPX files and return the dataframe together with a
+    route store holding the points of all the races, the identical .GPX files being stored only once. The races whose
+    .GPX file cannot be loaded are removed from the dataframe and listed in df.attrs["route_errors"] """
+
+    route_errors = {}
+    tracks = {}  # track id -> route, in the order of the first race of each track
+    race_track_ids = []
+    for gpx_filepath, (track_id, route, error) in zip(df["gpx_filepath"], load_routes(list(df["gpx_filepath"]))):
+        if route is None:
+            route_errors[gpx_filepath] = error
+            track_id = None
+        else:
+            tracks.setdefault(track_id, route)
+        race_track_ids.append(track_id)
+
+    df = df.loc[[track_id is not None for track_id in race_track_ids]].copy()
+    df.attrs["route_errors"] = route_errors
+    track_positions = {track_id: position for position, track_id in enumerate(tracks)}
+    route_store = RouteStore.from_arrays(df.index, list(tracks.values()),
+                                         race_tracks=[track_positions[track_id] for track_id in race_track_ids
+                                                      if track_id is not None],
+                                         track_ids=list(tracks),
+                                         dtype=ROUTE_POINT_DTYPE)
+
+    return df, route_store
+
+
+def read_gpx_start_point(filepath):
+    """ Return the latitude and longitude of the first track point of a .GPX file, reading only the beginning of the
+    file """
+
+    with open(filepath, "rb") as gpx_file:
+        for _, element in iterparse(gpx_file, events=("end",)):
+            if get_xml_local_name(element.tag) == "trkpt":
+                return float(element.get("lat")), float(element.get("lon"))
+
+    raise ValueError("The file does not contain track points")
+
+
+@profiled
+def add_start_point_data(df):
+    """ Get only the starting point of each race from the .GPX files and return the dataframe together with a route
+    store holding one point (the starting one) per race. The races whose .GPX file cannot be read are removed from the
+    dataframe and listed in df.attrs["route_errors"] """
+
+    start_points = []
+    route_errors = {}
+    for gpx_filepath in df["gpx_filepath"]:
+        try:
+            start_points.append(read_gpx_start_point(gpx_filepath))
+        except Exception as error:
+            route_errors[gpx_filepath] = f"{type(error).__name__}: {error}"
+            start_points.append(None)
+
+    df = df.loc[[start_point is not None for start_point in start_points]].copy()
+    df.attrs["route_errors"] = route_errors
+    start_points = np.array([start_point for start_point in start_points if start_point is not None],
+                            dtype=np.float64).reshape(-1, 2)
+    start_point_store = RouteStore(df.index,
+                                   {"lat": start_points[:, 0], "lon": start_points[:, 1]},
+                                   np.arange(len(df) + 1))
+
+    return df, start_point_store
+
+
+@profiled
+def load_race_route_data(df, race_id):
+    """ Get and process the route data of a single race (used when the routes are loaded lazily). Return a dataframe
+    with the race together with the route store and the pace store of the race. The returned dataframe is empty if the
+    .GPX file of the race cannot be loaded """
+
+    race_df, route_store = add_route_data(df.loc[[race_id]].copy())
+    if race_df.empty:
+        return race_df, route_store, None
+
+    race_df = add_dist_and_time_accumulative_route_data(race_df, route_store)
+    race_df, pace_store = add_pace_data(race_df, route_store)
+
+    return race_df, route_store, pace_store
+
+
+@profiled
+def add_dist_and_time_accumulative_route_data(df, route_store):
+    """ Add the total distance and time of the routes to the dataframe """
+
+    df["route_dist_total_km"] = route_store.last_rows("dist_accum_km", df.index)
+    df["route_duration_total_sec"] = route_store.last_rows("duration_accum_sec", df.index)
 
     return df
 
 
-def add_pace_data(df):
-    """ Calculate the pace for each km """
-
-    df["pace_sec"] = None
-    df["pace_timedelta"] = None
-    df["pace_timedelta_str"] = None
-    df["pace_dist_km"] = None
-    df["pace_average_calc_sec"] = None
-    df["pace_average_calc_timedelta"] = None
-    df["pace_average_calc_timedelta_str"] = None
-
-    for idx_row, row in df.iterrows():
-        dist_accum_km = row["route_points_dist_accum_km"]
-        duration_accum_sec = row["route_points_duration_accum_sec"]
-
-        pace_sec = []
-        pace_timedelta = []
-        pace_timedelta_str = []
-        pace_dist_km = []
-        last_km_mark = (None, None, None)  # (km_mark, distance, time)
-
-        for idx_step, step in enumerate(dist_accum_km):
-            km_current = math.modf(step)[1]
-            if km_current != last_km_mark[0]:
-                if last_km_mark[0] is not None:
-                    duration_diff = duration_accum_sec[idx_step] - last_km_mark[2]
-                    dist_diff = step - last_km_mark[1]
-                    pace_sec.append(int(duration_diff / dist_diff))
-                    pace_timedelta.append(timedelta(seconds=pace_sec[-1]))
-                    pace_timedelta_str.append(datetime.strftime(datetime(2025, 1, 1) +
-                                                                pace_timedelta[-1], "%H:%M:%S"))
-                    pace_dist_km.append(dist_diff)
-                last_km_mark = (km_current, step, duration_accum_sec[idx_step])
-
-        duration_diff = duration_accum_sec[-1] - last_km_mark[2]
-        dist_diff = dist_accum_km[-1] - last_km_mark[1]
-        pace_sec.append(int(duration_diff / dist_diff))
-        pace_timedelta.append(timedelta(seconds=pace_sec[-1]))
-        pace_timedelta_str.append(datetime.strftime(datetime(2025, 1, 1) +
-                                                    pace_timedelta[-1], "%H:%M:%S"))
-        pace_dist_km.append(dist_diff)
-
-        df.at[idx_row, "pace_sec"] = np.array(pace_sec)
-        df.at[idx_row, "pace_timedelta"] = np.array(pace_timedelta)
-        df.at[idx_row, "pace_timedelta_str"] = np.array(pace_timedelta_str)
-        df.at[idx_row, "pace_dist_km"] = np.array(pace_dist_km)
-
-        pace_average = duration_accum_sec[-1] / dist_accum_km[-1]
-        df.at[idx_row, "pace_average_calc_sec"] = int(pace_average)
-        df.at[idx_row, "pace_average_calc_timedelta"] = timedelta(seconds=int(pace_average))
-        df.at[idx_row, "pace_average_calc_timedelta_str"] = datetime.strftime(datetime(2025, 1, 1) +
-                                                                              timedelta(seconds=int(pace_average)), "%H:%M:%S")
-
-    return df
\ No newline at end of file
+@profiled
+def compute_splits(route_store, split_length_km):
+    """ Calculate, in one pass over all the tracks, the splits of the given length (the last split of a track covers
+    the remaining distance) and their pace. The time at each split mark is interpolated between the route points
+    around it, the durations of the splits of a track summing up to the duration of the track. Return a route store
+    holding the splits of all the races (the races sharing a track share its splits) """
+
+    dist_total_km = route_store.column("dist_accum_km")[route_store.offsets[1:] - 1]
+    track_positions = np.arange(route_store.tracks_count)
+
+    # Split marks of each track: 0, L, 2L, ... (all below the total distance) and the total distance
+    marks_count = np.maximum(np.ceil(dist_total_km / split_length_km).astype(np.int64) - 1, 0) + 2
+    marks_offsets = np.zeros(route_store.tracks_count + 1, dtype=np.int64)
+    marks_offsets[1:] = np.cumsum(marks_count)
+    marks_track_positions = np.repeat(track_positions, marks_count)
+    marks_dist_km = ((np.arange(marks_offsets[-1]) - marks_offsets[:-1][marks_track_positions]) *
+                     np.float64(split_length_km))
+    marks_dist_km[marks_offsets[1:] - 1] = dist_total_km
+
+    # Time at each mark, from the first point reaching it (so the time spent standing still at the start is part of the
+    # first split), except at the last mark of each track, which takes the time of the last point of the track
+    marks_duration_sec = route_store.interpolate("duration_accum_sec", "dist_accum_km", marks_track_positions,
+                                                 marks_dist_km)
+    marks_duration_sec[marks_offsets[1:] - 1] = route_store.column("duration_accum_sec")[route_store.offsets[1:] - 1]
+
+    # Differences between consecutive marks, without the ones between the last mark of a track and the first of the
+    # next
+    is_split = np.ones(max(marks_offsets[-1] - 1, 0), dtype=bool)
+    is_split[marks_offsets[1:-1] - 1] = False
+    split_dist_km = np.diff(marks_dist_km)[is_split]
+    split_duration_sec = np.diff(marks_duration_sec)[is_split]
+    split_end_km = marks_dist_km[1:][is_split]
+
+    splits_offsets = marks_offsets - np.arange(route_store.tracks_count + 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pace_sec = np.where(split_dist_km > 0, split_duration_sec / split_dist_km, 0).astype(np.int64)
+
+    return RouteStore(route_store.race_ids,
+                      {"pace_sec": pace_sec,
+                       "pace_dist_km": split_dist_km,
+                       "split_duration_sec": split_duration_sec,
+                       "split_end_km": split_end_km},
+                      splits_offsets,
+                      route_store.race_tracks,
+                      route_store.track_ids)
+
+
+@profiled
+def add_pace_data(df, route_store):
+    """ Calculate the pace for each km and return the dataframe together with a route store holding the pace values
+    of all the races """
+
+    pace_store = compute_splits(route_store, SPLIT_LENGTHS_KM["1 km"])
+
+    df["pace_average_calc_sec"] = (df["route_duration_total_sec"] / df["route_dist_total_km"]).astype(np.int64)
+    df["pace_average_calc_timedelta"] = pd.to_timedelta(df["pace_average_calc_sec"], unit="s")
+    df["pace_average_calc_timedelta_str"] = format_duration_sec(df["pace_average_calc_sec"])
+
+    return df, pace_store
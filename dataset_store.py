@@ -0,0 +1,283 @@
+from config import config
+from data_processing import (process_date_data, process_duration_data, add_route_data,
+                             add_dist_and_time_accumulative_route_data, ROUTE_POINT_DTYPE)
+from route_store import RouteStore
+from profiling import profiled
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Bump when the processed columns or the route store layout change, so that older datasets are processed again
+DATASET_FORMAT_VERSION = 4
+
+# Number of parts of the stored dataset (one per start adding races) above which they are merged into a single part
+DATASET_MAX_PARTS = 16
+
+# Bump when the layout of the exported bundle changes
+BUNDLE_FORMAT_VERSION = 2
+
+# Columns of the race results .CSV file
+CSV_COLUMNS = ["name", "distance", "date", "city", "country", "duration", "pace", "gpxfilename"]
+
+
+def get_athletes():
+    """ Return the athletes whose races are displayed: their name, the path of their .CSV file and of their .GPX folder.
+    Without the key athletes in the configuration file, a single unnamed athlete is built from the keys
+    csv_race_results_filepath and gpx_race_route_filepath """
+
+    if config.get("athletes"):
+        return config["athletes"]
+    return [{"name": "",
+             "csv_race_results_filepath": config["csv_race_results_filepath"],
+             "gpx_race_route_filepath": config["gpx_race_route_filepath"]}]
+
+
+def read_athlete_race_results(athlete):
+    """ Read the .CSV file of an athlete, adding the name of the athlete and the path of the .GPX file of each race """
+
+    df = pd.read_csv(athlete["csv_race_results_filepath"],
+                     parse_dates=["date"],
+                     date_format="%Y-%m-%d")
+    df["athlete"] = athlete["name"]
+    df["gpx_filepath"] = athlete["gpx_race_route_filepath"] + df["gpxfilename"]
+    return df
+
+
+@profiled
+def read_race_results():
+    """ Read the .CSV files of all the athletes (one shard per athlete, in parallel) into a single dataframe """
+
+    athletes = get_athletes()
+    with ThreadPoolExecutor(max_workers=min(len(athletes), os.cpu_count() or 1)) as executor:
+        shards = list(executor.map(read_athlete_race_results, athletes))
+    return pd.concat(shards, ignore_index=True)
+
+
+def get_file_fingerprint(filepath):
+    """ Return a fingerprint of a file based on its size and modification time """
+
+    try:
+        file_stat = os.stat(filepath)
+    except OSError:
+        return "missing"
+    return f"{file_stat.st_size}-{file_stat.st_mtime_ns}"
+
+
+def get_row_fingerprints(df):
+    """ Return the fingerprint of each race: a hash of its .CSV values, athlete and .GPX file path combined with the
+    fingerprint of its .GPX file """
+
+    row_hashes = pd.util.hash_pandas_object(df[CSV_COLUMNS + ["athlete", "gpx_filepath"]], index=False)
+    return [f"{DATASET_FORMAT_VERSION}-{row_hash:016x}-{get_file_fingerprint(gpx_filepath)}"
+            for row_hash, gpx_filepath in zip(row_hashes, df["gpx_filepath"])]
+
+
+def process_race_data(df):
+    """ Run the whole processing pipeline (up to the route data) on the given races """
+
+    df = process_date_data(df)
+    df = process_duration_data(df)
+    df, route_store = add_route_data(df)
+    df = add_dist_and_time_accumulative_route_data(df, route_store)
+    return df, route_store
+
+
+def get_dataset_part_dirpaths(dirpath):
+    """ Return the paths of the folders of the parts of a stored dataset, the oldest first """
+
+    try:
+        filenames = os.listdir(dirpath)
+    except OSError:
+        return []
+    return [os.path.join(dirpath, filename) for filename in sorted(filenames) if filename.startswith("part_")]
+
+
+@profiled
+def read_processed_dataset(dirpath):
+    """ Read the parts of a processed dataset saved with write_processed_dataset, the oldest first, memory-mapping
+    their routes. Return a list of (folder path, dataframe, route store) tuples, without the parts which cannot be read
+    (e.g. being deleted) """
+
+    parts = []
+    for part_dirpath in get_dataset_part_dirpaths(dirpath):
+        try:
+            df = pd.read_parquet(os.path.join(part_dirpath, "races.parquet"))
+            route_store = RouteStore.load(os.path.join(part_dirpath, "routes"))
+        except (OSError, ValueError):
+            continue
+        if len(route_store) == len(df) and set(route_store.columns) == set(ROUTE_POINT_DTYPE.names):
+            parts.append((part_dirpath, df, route_store))
+    return parts
+
+
+@profiled
+def write_processed_dataset(dirpath, df, route_store):
+    """ Write the processed race table (Parquet) and its route store (.npy columns) as a new part of the stored
+    dataset, which appears in the dataset folder only once everything is written. Return the path of the part, or None
+    if it could not be written """
+
+    # Unique temporary folder, so that the sessions writing parts at the same time do not share it. The parts are named
+    # after the time they are written, so that they are read in that order
+    os.makedirs(dirpath, exist_ok=True)
+    tmp_dirpath = tempfile.mkdtemp(prefix=".part_", suffix=".tmp", dir=dirpath)
+    part_dirpath = os.path.join(dirpath, f"part_{time.time_ns():020d}_{os.path.basename(tmp_dirpath)[6:-4]}")
+    try:
+        df.to_parquet(os.path.join(tmp_dirpath, "races.parquet"))
+        route_store.save(os.path.join(tmp_dirpath, "routes"))
+        os.replace(tmp_dirpath, part_dirpath)
+    except OSError:
+        # The races are simply processed again at the next start
+        shutil.rmtree(tmp_dirpath, ignore_errors=True)
+        return None
+    return part_dirpath
+
+
+def delete_dataset_parts(part_dirpaths):
+    """ Delete parts of the stored dataset, their race table first, so that a part which cannot be deleted completely
+    (e.g. its routes are memory-mapped by another session) is not read anymore """
+
+    for part_dirpath in part_dirpaths:
+        try:
+            os.remove(os.path.join(part_dirpath, "races.parquet"))
+        except OSError:
+            pass
+        shutil.rmtree(part_dirpath, ignore_errors=True)
+
+
+@profiled
+def load_processed_dataset(df):
+    """ Process the races read from the .CSV file, reusing the stored processed dataset for the races whose .CSV values
+    and .GPX file are unchanged, so that only the added or changed races are processed. The new races are appended to
+    the stored dataset as a new part, the parts being merged only once they are too many or hold mostly removed races.
+    Return the processed dataframe and its route store """
+
+    if not config.get("dataset_dirpath"):
+        return process_race_data(df)
+
+    df["row_fingerprint"] = get_row_fingerprints(df)
+    stored_parts = read_processed_dataset(config["dataset_dirpath"])
+    stored_rows_count = sum(len(stored_df) for _, stored_df, _ in stored_parts)
+    if not stored_parts:
+        # Remove the dataset stored directly in the dataset folder by the previous versions
+        shutil.rmtree(os.path.join(config["dataset_dirpath"], "routes"), ignore_errors=True)
+        try:
+            os.remove(os.path.join(config["dataset_dirpath"], "races.parquet"))
+        except OSError:
+            pass
+
+    parts = []
+    route_errors = {}
+    is_stored = pd.Series(False, index=df.index)
+
+    # Reuse the stored races (from the oldest part holding each of them), keeping the row labels of the .CSV file. Their
+    # routes are not copied
+    for _, stored_df, stored_route_store in stored_parts:
+        stored_idx = pd.Series(stored_df.index, index=stored_df["row_fingerprint"])
+        stored_idx = stored_idx[~stored_idx.index.duplicated()]
+        is_reused = ~is_stored & df["row_fingerprint"].isin(stored_idx.index)
+        if is_reused.any():
+            reused_labels = df.index[is_reused]
+            reused_stored_idx = stored_idx[df.loc[is_reused, "row_fingerprint"]].to_numpy()
+            parts.append((stored_df.loc[reused_stored_idx].set_axis(reused_labels),
+                          stored_route_store.with_races(reused_stored_idx, reused_labels)))
+            is_stored |= is_reused
+
+    # Process only the races which are not in the stored dataset and append them to it
+    new_part_dirpaths = []
+    if not is_stored.all() or not parts:
+        new_df, new_route_store = process_race_data(df.loc[~is_stored].copy())
+        route_errors = new_df.attrs["route_errors"]
+        if not new_df.empty or not parts:
+            parts.append((new_df, new_route_store))
+        if not new_df.empty:
+            new_part_dirpaths.append(write_processed_dataset(config["dataset_dirpath"], new_df, new_route_store))
+            stored_rows_count += len(new_df)
+
+    # Merge the reused and the new races, in the order of the .CSV file (the routes of several parts being copied once)
+    if len(parts) == 1:
+        merged_df, merged_route_store = parts[0]
+    else:
+        merged_df = pd.concat([part[0] for part in parts]).sort_index()
+        merged_route_store = RouteStore.concatenate([part[1] for part in parts]).with_races(merged_df.index)
+
+    # Merge the stored parts into a single one when they are too many or hold mostly removed or changed races
+    merged_part_dirpaths = [part_dirpath for part_dirpath, _, _ in stored_parts] + new_part_dirpaths
+    if len(merged_part_dirpaths) > DATASET_MAX_PARTS or stored_rows_count > 2 * len(merged_df):
+        merged_route_store = merged_route_store.select(merged_df.index)
+        # Release the memory-mapped routes of the merged parts, so that their folders can be deleted
+        stored_parts = parts = None
+        if write_processed_dataset(config["dataset_dirpath"], merged_df, merged_route_store) is not None:
+            delete_dataset_parts(part_dirpath for part_dirpath in merged_part_dirpaths if part_dirpath is not None)
+
+    merged_df.attrs["route_errors"] = route_errors
+    return merged_df, merged_route_store
+
+
+def get_dataset_fingerprint(df):
+    """ Return a fingerprint of the whole dataset (all the races read from the .CSV files and their .GPX files) """
+
+    return hashlib.sha1("\n".join(get_row_fingerprints(df)).encode("utf-8")).hexdigest()
+
+
+def write_bundle(dirpath, df, route_store):
+    """ Write a read-only bundle of the processed dataset: the race table (Parquet, with the offset and the number of
+    route points of each race) and the flat route table (uncompressed Arrow IPC file, which can be memory-mapped). The
+    races sharing a track have the same offset, the track being written only once """
+
+    df = df.drop(columns=["row_fingerprint"], errors="ignore").copy()
+    df.attrs = {}
+    route_store = route_store.select(df.index)
+    df["route_offset"] = route_store.offsets[:-1][route_store.race_tracks]
+    df["route_points_count"] = route_store.lengths
+
+    races = pa.Table.from_pandas(df)
+    races = races.replace_schema_metadata({**races.schema.metadata,
+                                           b"bundle_format_version": str(BUNDLE_FORMAT_VERSION).encode()})
+    routes = pa.table({field: np.asarray(column) for field, column in route_store.columns.items()})
+
+    os.makedirs(dirpath, exist_ok=True)
+    pq.write_table(races, os.path.join(dirpath, "races.parquet"))
+    # A single record batch, so that each column is read back as one contiguous memory-mapped array
+    with pa.OSFile(os.path.join(dirpath, "routes.arrow"), "wb") as routes_file:
+        with pa.ipc.new_file(routes_file, routes.schema) as writer:
+            writer.write_table(routes, max_chunksize=max(routes.num_rows, 1))
+
+
+@profiled
+def read_bundle(dirpath):
+    """ Read a bundle written with write_bundle, memory-mapping the route table. Return the race dataframe and its
+    route store """
+
+    races = pq.read_table(os.path.join(dirpath, "races.parquet"), memory_map=True)
+    bundle_format_version = (races.schema.metadata or {}).get(b"bundle_format_version", b"").decode()
+    if bundle_format_version != str(BUNDLE_FORMAT_VERSION):
+        raise ValueError(f"Unsupported bundle format version: {bundle_format_version or 'unknown'}")
+    df = races.to_pandas()
+    df.attrs = {"route_errors": {}}
+
+    with pa.memory_map(os.path.join(dirpath, "routes.arrow"), "r") as routes_file:
+        routes = pa.ipc.open_file(routes_file).read_all()
+    columns = {field: routes.column(field).combine_chunks().to_numpy(zero_copy_only=True)
+               for field in routes.column_names}
+
+    # Tracks of the races, sorted by offset (an empty track coming before the track starting at the same offset)
+    tracks, race_tracks = np.unique(df[["route_offset", "route_points_count"]].to_numpy(), axis=0,
+                                    return_inverse=True)
+    route_store = RouteStore(df.index, columns, np.append(tracks[:, 0], routes.num_rows), race_tracks.ravel())
+    df = df.drop(columns=["route_offset", "route_points_count"])
+
+    return df, route_store
+
+
+def get_bundle_fingerprint(dirpath):
+    """ Return a fingerprint of a bundle based on the size and modification time of its files """
+
+    return "-".join(get_file_fingerprint(os.path.join(dirpath, filename))
+                    for filename in ("races.parquet", "routes.arrow"))
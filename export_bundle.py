@@ -0,0 +1,40 @@
+""" Export of the processed dataset as a read-only bundle, from which the WebApp can start without processing the .CSV
+and .GPX files (see the configuration key start_from_bundle).
+
+Usage: python -m export_bundle [--output DIR]
+"""
+from config import config
+import argparse
+import sys
+from dataset_store import read_race_results, load_processed_dataset, write_bundle
+
+
+def export_bundle(dirpath):
+    """ Run the whole processing pipeline on the races of the .CSV files and write the result as a bundle into the
+    given folder. Return the processed dataframe """
+
+    df, route_store = load_processed_dataset(read_race_results())
+    for gpx_filepath, route_error in df.attrs["route_errors"].items():
+        print(f"The route file {gpx_filepath} could not be loaded ({route_error}). The race is not exported.",
+              file=sys.stderr)
+
+    write_bundle(dirpath, df, route_store)
+    return df
+
+
+def main():
+    """ Parse the command line arguments and export the bundle """
+
+    parser = argparse.ArgumentParser(description="Process the race results and their routes and export them as a "
+                                                 "read-only bundle")
+    parser.add_argument("--output", default=config["bundle_dirpath"],
+                        help="path of the bundle folder (by default, the value of the configuration key "
+                             "bundle_dirpath)")
+    args = parser.parse_args()
+
+    df = export_bundle(args.output)
+    print(f"Exported {len(df)} races into {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
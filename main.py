@@ -1,28 +1,136 @@
 from config import config
 import pandas as pd
 import streamlit as st
-from data_processing import (process_date_data, process_duration_data, add_route_data,
-                             add_dist_and_time_accumulative_route_data, add_pace_data)
+from data_processing import (process_date_data, process_duration_data, add_start_point_data, load_race_route_data,
+                             add_pace_data, compute_splits, format_duration_sec, SPLIT_LENGTHS_KM)
+from dataset_store import (read_race_results, load_processed_dataset, get_dataset_fingerprint, read_bundle,
+                           get_bundle_fingerprint)
+from best_efforts import compute_best_efforts, get_personal_bests
+from memo_cache import MemoCache, SessionMemoCache
+from route_cache import clear_cached_routes
+from profiling import new_profiler, current_profiler
+from spatial_index import SpatialIndex
+from race_aggregation import AGGREGATION_PERIODS, aggregate_time_per_km, count_races_per_distance
 from plotting import *
 
+
+@st.cache_resource
+def get_memo_cache():
+    """ Return the cache of the processed dataset and of the figures, shared by all the reruns of the app """
+
+    return MemoCache(config["memo_cache_max_entries"], config["memo_cache_max_size_mb"] * 1024 * 1024)
+
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def get_dataset(dataset_key, _loader, _source):
+    """ Return the processed dataset identified by the key (kind and fingerprint of the dataset), loaded by calling
+    the loader with the source (races read from the CSV files or folder of the bundle). It is kept apart from the memo
+    cache, so that a dataset larger than the size of the memo cache is not loaded again at every rerun """
+
+    return _loader(_source)
+
+
+def load_dataset(df):
+    """ Process the races read from the CSV file and calculate their pace """
+
+    df, route_store = load_processed_dataset(df)
+    df, pace_store = add_pace_data(df, route_store)
+    return df, route_store, pace_store
+
+
+def load_dataset_from_bundle(dirpath):
+    """ Read the processed races from an exported bundle (memory-mapping their routes) and calculate their pace """
+
+    df, route_store = read_bundle(dirpath)
+    df, pace_store = add_pace_data(df, route_store)
+    return df, route_store, pace_store
+
+
+def load_dataset_lazily(df):
+    """ Process the races read from the CSV file, getting only the starting points of the routes (the whole routes are
+    loaded when a race is selected) """
+
+    df = process_date_data(df)
+    df = process_duration_data(df)
+    df, start_point_store = add_start_point_data(df)
+    return df, start_point_store, None
+
+
+def format_efforts(df, efforts):
+    """ Prepare the best efforts for being displayed in a table, together with the data of their races (and their
+    athlete when there are several athletes) """
+
+    table = pd.DataFrame({"Distance (km)": efforts["distance_km"].to_numpy(),
+                          "Time": format_duration_sec(efforts["duration_sec"]),
+                          "Pace": format_duration_sec(efforts["pace_sec"]),
+                          "From km": efforts["start_km"].round(2).to_numpy(),
+                          "Race": df.loc[efforts["race_id"], "name"].to_numpy(),
+                          "Date": df.loc[efforts["race_id"], "date_str"].to_numpy()})
+    if df["athlete"].nunique() > 1:
+        table["Athlete"] = df.loc[efforts["race_id"], "athlete"].to_numpy()
+    return table
+
+
+# The cache is shared by all the sessions, the statistics of the reruns are kept per session
+if "memo_cache" not in st.session_state:
+    st.session_state["memo_cache"] = SessionMemoCache(get_memo_cache())
+memo_cache = st.session_state["memo_cache"]
+memo_cache.start_rerun()
+
+# The profiler is kept per session, so that the reruns of the other sessions are neither recorded into it nor reset it
+if "profiler" not in st.session_state:
+    st.session_state["profiler"] = new_profiler()
+profiler = st.session_state["profiler"]
+current_profiler.set(profiler)
+profiler.start_rerun()
+
 st.title("Race Results Visualizer")
 
-# Read the data from the CSV file and process it
-df = pd.read_csv(config["csv_race_results_filepath"],
-                 parse_dates=["date"],
-                 date_format="%Y-%m-%d")
-df = process_date_data(df)
-df = process_duration_data(df)
-df = add_route_data(df)
-df = add_dist_and_time_accumulative_route_data(df)
-df = add_pace_data(df)
-
-# Plot the average time per km
+# Read the data from the exported bundle, or from the CSV files of the athletes and process it (only the races which are
+# not in the stored processed dataset). The processed data is kept w.r.t. the fingerprint of the dataset and the figures
+# are cached w.r.t. the fingerprint of the dataset and the selected options
+lazy_route_loading = config["lazy_route_loading"] and not config["start_from_bundle"]
+if config["start_from_bundle"]:
+    dataset_fingerprint = get_bundle_fingerprint(config["bundle_dirpath"])
+    df, route_store, pace_store = get_dataset(("dataset_bundle", dataset_fingerprint), load_dataset_from_bundle,
+                                              config["bundle_dirpath"])
+else:
+    df = read_race_results()
+    dataset_fingerprint = get_dataset_fingerprint(df)
+    if lazy_route_loading:
+        df, route_store, pace_store = get_dataset(("dataset_lazy", dataset_fingerprint), load_dataset_lazily, df)
+    else:
+        df, route_store, pace_store = get_dataset(("dataset", dataset_fingerprint), load_dataset, df)
+for gpx_filepath, route_error in df.attrs["route_errors"].items():
+    st.warning(f"The route file {gpx_filepath} could not be loaded ({route_error}). The race is not displayed.")
+
+# With several athletes, the races of all of them or of a single one are displayed
+athletes = list(df["athlete"].unique())
+is_multi_athlete = len(athletes) > 1
+athlete_option = st.selectbox(label="Athlete", options=["All"] + athletes) if is_multi_athlete else "All"
+athlete_df = df if athlete_option == "All" else df.loc[df["athlete"] == athlete_option]
+
+# Plot the average time per km. Above the row threshold, the races are aggregated per period (and counted per distance
+# in the next plot) before being plotted, instead of plotting one marker per race
+is_aggregated = len(athlete_df) > config["aggregation_row_threshold"]
 st.header("Average time per km")
 race_distance_option = st.selectbox(label="Race length",
                                     options=["All", "5 & 6 km", "10 km"])
+if is_aggregated:
+    period_option = st.selectbox(label="Aggregation period",
+                                 options=list(AGGREGATION_PERIODS))
 try:
-    figure = plot_time_per_km(df, race_distance_option)
+    if is_aggregated:
+        aggregates = memo_cache.get_or_build(("aggregate_time_per_km", dataset_fingerprint, athlete_option,
+                                              race_distance_option, period_option),
+                                             aggregate_time_per_km, athlete_df, race_distance_option, period_option)
+        figure = memo_cache.get_or_build(("plot_time_per_km_aggregated", dataset_fingerprint, athlete_option,
+                                          race_distance_option, period_option),
+                                         plot_time_per_km_aggregated, aggregates)
+    else:
+        figure = memo_cache.get_or_build(("plot_time_per_km", dataset_fingerprint, athlete_option,
+                                          race_distance_option),
+                                         plot_time_per_km, athlete_df, race_distance_option)
 except IndexError:
     st.error("No data available")
 else:
@@ -30,25 +138,147 @@ else:
 
 # Plot the number of races w.r.t. distance
 st.header("Number of races w.r.t. Distance")
-figure = plot_number_of_races(df)
+if is_aggregated:
+    distance_counts = memo_cache.get_or_build(("count_races_per_distance", dataset_fingerprint, athlete_option),
+                                              count_races_per_distance, athlete_df)
+    figure = memo_cache.get_or_build(("plot_number_of_races_aggregated", dataset_fingerprint, athlete_option),
+                                     plot_number_of_races_aggregated, distance_counts)
+else:
+    figure = memo_cache.get_or_build(("plot_number_of_races", dataset_fingerprint, athlete_option),
+                                     plot_number_of_races, athlete_df)
 st.plotly_chart(figure)
 
 # Plot the locations of the starting points on a map
 st.header("Locations of the Starting Points")
-figure = plot_starting_points(df)
+figure = memo_cache.get_or_build(("plot_starting_points", dataset_fingerprint, athlete_option),
+                                 plot_starting_points, athlete_df, route_store)
 st.plotly_chart(figure)
 
 # Plot the route, elevation and pace for a chosen race
 st.header("Route, Elevation and Pace")
-race_option = st.selectbox(label="Race name",
-                           options=df["name"])
-race_option_index = df.index[df["name"] == race_option][0]
-st.subheader("Route points")
-figure = plot_route(df, race_option_index)
-st.plotly_chart(figure)
-st.subheader("Elevation")
-figure = plot_elevation(df, race_option_index)
-st.plotly_chart(figure)
-st.subheader("Pace")
-figure = plot_pace(df, race_option_index)
-st.plotly_chart(figure)
+# The races are selected by their row index, since several athletes can have a race with the same name
+race_option_index = st.selectbox(label="Race name",
+                                 options=athlete_df.index,
+                                 format_func=lambda idx: (f"{df.at[idx, 'name']} ({df.at[idx, 'athlete']})"
+                                                          if athlete_option == "All" and is_multi_athlete
+                                                          else df.at[idx, "name"]))
+if lazy_route_loading:
+    # Load the route of the selected race only now (and keep it for the next reruns)
+    race_df, race_route_store, race_pace_store = memo_cache.get_or_build(
+        ("load_race_route_data", dataset_fingerprint, race_option_index), load_race_route_data, df, race_option_index)
+    for gpx_filepath, route_error in race_df.attrs["route_errors"].items():
+        st.error(f"The route file {gpx_filepath} could not be loaded ({route_error}).")
+else:
+    race_df, race_route_store, race_pace_store = df, route_store, pace_store
+
+if not race_df.empty:
+    st.subheader("Route points")
+    figure = memo_cache.get_or_build(("plot_route", dataset_fingerprint, race_option_index),
+                                     plot_route, race_df, race_route_store, race_option_index)
+    st.plotly_chart(figure)
+    st.subheader("Elevation")
+    figure = memo_cache.get_or_build(("plot_elevation", dataset_fingerprint, race_option_index),
+                                     plot_elevation, race_df, race_route_store, race_option_index)
+    st.plotly_chart(figure)
+    st.subheader("Pace")
+    split_length_option = st.selectbox(label="Split length",
+                                       options=list(SPLIT_LENGTHS_KM) + ["Custom"])
+    if split_length_option == "Custom":
+        split_length_km = st.number_input(label="Custom split length (km)",
+                                          min_value=0.1, value=2.0, step=0.1)
+    else:
+        split_length_km = SPLIT_LENGTHS_KM[split_length_option]
+    if split_length_km != SPLIT_LENGTHS_KM["1 km"]:
+        # When the routes are loaded lazily, the route store only holds the selected race
+        splits_key = ("compute_splits", dataset_fingerprint, split_length_km)
+        if lazy_route_loading:
+            splits_key += (race_option_index,)
+        race_pace_store = memo_cache.get_or_build(splits_key, compute_splits, race_route_store, split_length_km)
+    figure = memo_cache.get_or_build(("plot_pace", dataset_fingerprint, race_option_index, split_length_km),
+                                     plot_pace, race_df, race_pace_store, race_option_index)
+    st.plotly_chart(figure)
+
+# Show the fastest efforts over the usual distances
+st.header("Best Efforts")
+if not race_df.empty:
+    # When the routes are loaded lazily, only the efforts of the selected race are available
+    efforts_key = ("compute_best_efforts", dataset_fingerprint)
+    if lazy_route_loading:
+        efforts_key += (race_option_index,)
+    efforts = memo_cache.get_or_build(efforts_key, compute_best_efforts, race_route_store,
+                                      config["best_effort_distances_km"])
+    if not lazy_route_loading:
+        st.subheader("Personal bests")
+        athlete_efforts = efforts.loc[efforts["race_id"].isin(athlete_df.index)]
+        st.dataframe(format_efforts(df, get_personal_bests(athlete_efforts)), hide_index=True)
+    st.subheader("Best efforts of the selected race")
+    st.dataframe(format_efforts(df, efforts.loc[efforts["race_id"] == race_option_index]), hide_index=True)
+
+# Search the races w.r.t. the locations of their routes
+st.header("Route Search")
+if lazy_route_loading:
+    st.info("The route search is not available when the routes are loaded lazily.")
+elif not race_df.empty:
+    spatial_index = memo_cache.get_or_build(("spatial_index", dataset_fingerprint),
+                                            SpatialIndex, route_store, config["spatial_index_cell_size_m"])
+    race_columns = ["name", "date_str", "distance", "city"] + (["athlete"] if is_multi_athlete else [])
+
+    st.subheader("Races near a point")
+    search_lat = st.number_input(label="Latitude (°N)", format="%.6f",
+                                 value=float(route_store.first_rows("lat", [race_option_index])[0]))
+    search_lon = st.number_input(label="Longitude (°E)", format="%.6f",
+                                 value=float(route_store.first_rows("lon", [race_option_index])[0]))
+    search_radius_m = st.number_input(label="Radius (m)", min_value=10, value=200, step=10)
+    races = spatial_index.races_near(search_lat, search_lon, search_radius_m)
+    st.dataframe(df.loc[races.index, race_columns].join(races.round(1)), hide_index=True)
+
+    st.subheader("Races sharing a segment with the selected race")
+    min_shared_percentage = st.slider(label="Minimum shared part of the route (%)",
+                                      min_value=5, max_value=100, value=20, step=5)
+    races = spatial_index.races_sharing_route(race_option_index, config["segment_match_radius_m"],
+                                              min_shared_percentage / 100)
+    races["shared_percentage"] = (races.pop("shared_fraction") * 100).round(1)
+    st.dataframe(df.loc[races.index, race_columns].join(races), hide_index=True)
+
+    st.subheader("Fastest time on a segment of the selected race")
+    route_length_km = float(route_store.last_rows("dist_accum_km", [race_option_index])[0])
+    segment_km = st.slider(label="Segment of the selected race (km)",
+                           min_value=0.0, max_value=round(route_length_km, 1),
+                           value=(0.0, min(1.0, round(route_length_km, 1))), step=0.1)
+    if segment_km[1] > segment_km[0]:
+        efforts = spatial_index.fastest_on_segment(race_option_index, segment_km[0], segment_km[1],
+                                                   config["segment_match_radius_m"])
+        efforts["segment_duration"] = format_duration_sec(efforts["segment_duration_sec"])
+        efforts["segment_pace"] = format_duration_sec(efforts["segment_duration_sec"] / efforts["segment_dist_km"])
+        st.dataframe(df.loc[efforts.index, race_columns].join(efforts[["segment_duration", "segment_pace"]]),
+                     hide_index=True)
+
+# Show the statistics of the cache
+with st.sidebar.expander("Cache statistics"):
+    st.write(f"**This rerun:** {memo_cache.stats_rerun['hits']} hits, {memo_cache.stats_rerun['misses']} misses, "
+             f"{memo_cache.stats_rerun['time_saved_sec']:.3f} s saved, "
+             f"{memo_cache.stats_rerun['time_built_sec']:.3f} s spent building")
+    st.write(f"**Total (all sessions):** {memo_cache.cache.stats_total['hits']} hits, "
+             f"{memo_cache.cache.stats_total['misses']} misses, "
+             f"{memo_cache.cache.stats_total['time_saved_sec']:.3f} s saved")
+    st.write(f"**Entries:** {len(memo_cache.cache.entries)} / {memo_cache.cache.max_entries}, "
+             f"{memo_cache.cache.size_bytes / 1024 / 1024:.1f} / {memo_cache.cache.max_size_bytes / 1024 / 1024:.0f} "
+             f"MB")
+    if memo_cache.stats_rerun["too_large"]:
+        st.warning(f"{memo_cache.stats_rerun['too_large']} values of this rerun were larger than the memo cache "
+                   f"(memo_cache_max_size_mb) and are built again at every rerun")
+    if st.button("Clear the caches", help="Delete the parsed route data cached on disk and drop the processed dataset "
+                                          "and the figures kept in memory"):
+        clear_cached_routes()
+        memo_cache.cache.clear()
+        get_dataset.clear()
+
+# Show the time spent in each stage of the pipeline and in each plot (only when enabled in the configuration file)
+profiler.end_rerun()
+if config["profiling_enabled"]:
+    with st.sidebar.expander("Profiling"):
+        st.write(f"**This rerun:** {profiler.history[-1]['wall_sec']:.3f} s (only the values which were not cached "
+                 f"are built and recorded)")
+        st.dataframe(profiler.get_records_table(), hide_index=True)
+        st.write("**Recent reruns:**")
+        st.dataframe(profiler.get_history_table(), hide_index=True)
@@ -0,0 +1,119 @@
+from collections import OrderedDict
+import sys
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+
+def estimate_size_bytes(value):
+    """ Estimate the memory used by a cached value (dataframes, arrays, route stores, figures and their containers) """
+
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    if hasattr(value, "to_plotly_json"):
+        return estimate_size_bytes(value.to_plotly_json())
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size_bytes(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size_bytes(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class MemoCache:
+    """ Least recently used cache of computed values (e.g. figures), bounded by a number of entries and by an estimated
+    memory size, which records its hits, misses and the time saved by the hits. It is shared by the sessions of the
+    app, which run in their own threads """
+
+    def __init__(self, max_entries, max_size_bytes):
+        self.max_entries = max_entries
+        self.max_size_bytes = max_size_bytes
+        self.entries = OrderedDict()  # key -> (value, size in bytes, build duration in seconds)
+        self.size_bytes = 0
+        self.stats_total = self.new_stats()
+        self.lock = threading.RLock()  # guards the entries, their size and the total statistics
+
+    @staticmethod
+    def new_stats():
+        """ Return empty statistics """
+
+        return {"hits": 0, "misses": 0, "too_large": 0, "time_saved_sec": 0.0, "time_built_sec": 0.0}
+
+    def record(self, stats, stat, value):
+        """ Add a value to a statistic of the whole lifetime of the cache and to the given statistics (e.g. of the
+        current rerun of a session), if any """
+
+        self.stats_total[stat] += value
+        if stats is not None:
+            stats[stat] += value
+
+    def get_or_build(self, key, builder, *args, stats=None):
+        """ Return the cached value for the key, or build it by calling the builder with the given arguments and cache
+        it. A value larger than the maximum size of the cache is not cached (it is built again at every call) and
+        recorded as too large. The hits and misses are recorded into the given statistics too """
+
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                value, _, build_duration_sec = self.entries[key]
+                self.record(stats, "hits", 1)
+                self.record(stats, "time_saved_sec", build_duration_sec)
+                return value
+
+        # Built without holding the lock, so that a slow build does not block the other sessions (two sessions may then
+        # build the same value, only the first one being cached)
+        time_start = time.perf_counter()
+        value = builder(*args)
+        build_duration_sec = time.perf_counter() - time_start
+
+        size_bytes = estimate_size_bytes(value)
+        with self.lock:
+            self.record(stats, "misses", 1)
+            self.record(stats, "time_built_sec", build_duration_sec)
+            if size_bytes > self.max_size_bytes:
+                self.record(stats, "too_large", 1)
+            elif key not in self.entries:
+                self.entries[key] = (value, size_bytes, build_duration_sec)
+                self.size_bytes += size_bytes
+                self.evict()
+
+        return value
+
+    def evict(self):
+        """ Drop the least recently used entries until the cache is within its limits """
+
+        with self.lock:
+            while self.entries and (len(self.entries) > self.max_entries or self.size_bytes > self.max_size_bytes):
+                _, (_, size_bytes, _) = self.entries.popitem(last=False)
+                self.size_bytes -= size_bytes
+
+    def clear(self):
+        """ Drop all the entries """
+
+        with self.lock:
+            self.entries.clear()
+            self.size_bytes = 0
+
+
+class SessionMemoCache:
+    """ Access of a session of the app to the shared MemoCache, recording the statistics of the current rerun of the
+    session """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.stats_rerun = MemoCache.new_stats()
+
+    def start_rerun(self):
+        """ Reset the statistics of the current rerun of the session """
+
+        self.stats_rerun = MemoCache.new_stats()
+
+    def get_or_build(self, key, builder, *args):
+        """ Return the cached value for the key, or build it by calling the builder with the given arguments and cache
+        it """
+
+        return self.cache.get_or_build(key, builder, *args, stats=self.stats_rerun)
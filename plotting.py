@@ -1,45 +1,60 @@
 from datetime import datetime, timedelta
+from data_processing import format_duration_sec
+from route_simplification import select_route_points, select_profile_points
+from race_aggregation import filter_races_by_distance, DISTANCE_BUCKET_KM
+from profiling import profiled
 import plotly.express as px
 import plotly.graph_objects as pg
 import numpy as np
 
 
+def get_duration_ticks(min_duration, max_duration, delta_duration_sec=20):
+    """ Return the values (in seconds) and the labels ("HH:MM:SS") of the ticks of a time per km axis """
+
+    duration_ticks = list(range(int(min_duration), int(max_duration), delta_duration_sec))
+
+    duration_labels = []
+    time_zero = datetime(2025, 1, 1)
+    for tick in duration_ticks:
+        duration_labels.append((time_zero + timedelta(seconds=tick)).strftime("%H:%M:%S"))
+
+    return duration_ticks, duration_labels
+
+
+@profiled
 def plot_time_per_km(df, race_distance_option):
     """ Prepare and create the plot of date vs. time per km """
 
-    match race_distance_option:
-        case "5 & 6 km":
-            df = df.loc[df["distance"].isin([5, 6])]
-        case "10 km":
-            df = df.loc[df["distance"] == 10]
+    df = filter_races_by_distance(df, race_distance_option)
 
     if not df.empty:
-        delta_duration_sec = 20
-        min_duration = int(df["duration_km_sec"].min())
-        max_duration = int(df["duration_km_sec"].max())
-        duration_ticks = list(range(min_duration, max_duration, delta_duration_sec))
+        duration_ticks, duration_labels = get_duration_ticks(df["duration_km_sec"].min(),
+                                                             df["duration_km_sec"].max())
 
-        duration_labels = []
-        time_zero = datetime(2025, 1, 1)
-        for tick in duration_ticks:
-            duration_labels.append((time_zero + timedelta(seconds=tick)).strftime("%H:%M:%S"))
+        # With several athletes, each athlete has its own line
+        is_multi_athlete = df["athlete"].nunique() > 1
+        customdata = np.stack((df["duration_km_timedelta_str"],
+                               df["name"],
+                               df["city"],
+                               df["country"],
+                               df["distance"]), axis=-1)
 
         figure = px.line(x=df["date"],
                          y=df["duration_km_sec"],
-                         labels={"x": "Date", "y": "Average time per km"},
+                         color=df["athlete"] if is_multi_athlete else None,
+                         labels={"x": "Date", "y": "Average time per km", "color": "Athlete"},
                          markers=True)
         figure.update_traces(marker=dict(size=10),
-                             customdata=np.stack((df["duration_km_timedelta_str"],
-                                                  df["name"],
-                                                  df["city"],
-                                                  df["country"],
-                                                  df["distance"]), axis=-1),
+                             customdata=customdata,
                              hovertemplate='<b>Date</b>: %{x} <br>'
                                            '<b>Time per km</b>: %{customdata[0]} <br>'
                                            '<b>Distance</b>: %{customdata[4]} km <br>'
                                            '<b>Race</b>: %{customdata[1]} <br>'
                                            '<b>City</b>: %{customdata[2]} <br>'
                                            '<b>Country</b>: %{customdata[3]}')
+        if is_multi_athlete:
+            figure.for_each_trace(lambda trace: trace.update(
+                customdata=customdata[(df["athlete"] == trace.name).to_numpy()]))
         figure.update_layout(yaxis=dict(tickmode="array",
                                         tickvals=duration_ticks,
                                         ticktext=duration_labels))
@@ -51,10 +66,77 @@ def plot_time_per_km(df, race_distance_option):
     return figure
 
 
+@profiled
+def plot_time_per_km_aggregated(aggregates):
+    """ Prepare and create the plot of date vs. time per km from the races aggregated per athlete and period: the
+    median line, the 25-75 percentile band and the 10-90 percentile band (of each athlete when there are several
+    athletes) """
+
+    if aggregates.empty:
+        raise IndexError("No data available")
+
+    duration_ticks, duration_labels = get_duration_ticks(aggregates["min"].min(), aggregates["max"].max())
+
+    # With several athletes, each athlete has its own median line and bands, in its own color
+    athletes = aggregates["athlete"].unique()
+    is_multi_athlete = len(athletes) > 1
+    figure = pg.Figure()
+    for athlete_idx, athlete in enumerate(athletes):
+        athlete_aggregates = aggregates.loc[aggregates["athlete"] == athlete]
+        x = athlete_aggregates["period_start"]
+        if is_multi_athlete:
+            line_color = px.colors.qualitative.Plotly[athlete_idx % len(px.colors.qualitative.Plotly)]
+            red, green, blue = px.colors.hex_to_rgb(line_color)
+            name_prefix = f"{athlete}: "
+            athlete_hovertemplate = f"<b>Athlete</b>: {athlete} <br>"
+        else:
+            line_color = "darkblue"
+            red, green, blue = 0, 0, 139
+            name_prefix = ""
+            athlete_hovertemplate = ""
+
+        for lower, upper, band_name, band_opacity in (("p10", "p90", "10-90 percentile", 0.15),
+                                                      ("p25", "p75", "25-75 percentile", 0.3)):
+            figure.add_trace(pg.Scatter(x=x, y=athlete_aggregates[lower], mode="lines", line=dict(width=0),
+                                        legendgroup=athlete if is_multi_athlete else None,
+                                        showlegend=False, hoverinfo="skip"))
+            figure.add_trace(pg.Scatter(x=x, y=athlete_aggregates[upper], mode="lines", line=dict(width=0),
+                                        fill="tonexty", fillcolor=f"rgba({red}, {green}, {blue}, {band_opacity})",
+                                        legendgroup=athlete if is_multi_athlete else None,
+                                        name=name_prefix + band_name, hoverinfo="skip"))
+        figure.add_trace(pg.Scatter(x=x, y=athlete_aggregates["median"], mode="lines+markers",
+                                    name=name_prefix + "Median",
+                                    legendgroup=athlete if is_multi_athlete else None,
+                                    line=dict(color=line_color),
+                                    customdata=np.stack((format_duration_sec(athlete_aggregates["median"]),
+                                                         format_duration_sec(athlete_aggregates["min"]),
+                                                         format_duration_sec(athlete_aggregates["max"]),
+                                                         athlete_aggregates["count"]), axis=-1),
+                                    hovertemplate=athlete_hovertemplate +
+                                                  '<b>Period start</b>: %{x} <br>'
+                                                  '<b>Median time per km</b>: %{customdata[0]} <br>'
+                                                  '<b>Fastest time per km</b>: %{customdata[1]} <br>'
+                                                  '<b>Slowest time per km</b>: %{customdata[2]} <br>'
+                                                  '<b>Number of races</b>: %{customdata[3]}'
+                                                  '<extra></extra>'))
+    figure.update_layout(xaxis_title_text="Date",
+                         yaxis_title_text="Average time per km",
+                         yaxis=dict(tickmode="array",
+                                    tickvals=duration_ticks,
+                                    ticktext=duration_labels))
+    figure.update_xaxes(showspikes=True, spikecolor="darkblue")
+    figure.update_yaxes(showspikes=True, spikecolor="darkblue")
+
+    return figure
+
+
+@profiled
 def plot_number_of_races(df):
-    """ Prepare and create the plot of number of races """
+    """ Prepare and create the plot of number of races (stacked per athlete when there are several athletes) """
 
     figure = px.histogram(x=df["distance"],
+                          color=df["athlete"] if df["athlete"].nunique() > 1 else None,
+                          labels={"color": "Athlete"},
                           text_auto=True)
     figure.update_layout(xaxis_title_text="Distance (km)",
                          yaxis_title_text="Number of races")
@@ -63,11 +145,32 @@ def plot_number_of_races(df):
     return figure
 
 
-def plot_starting_points(df):
+@profiled
+def plot_number_of_races_aggregated(distance_counts):
+    """ Prepare and create the plot of number of races from the races already counted per bucket of distances and
+    athlete (stacked per athlete when there are several athletes) """
+
+    figure = px.bar(distance_counts,
+                    x=(distance_counts["distance_start_km"] + distance_counts["distance_end_km"]) / 2,
+                    y="races_count",
+                    color="athlete" if distance_counts["athlete"].nunique() > 1 else None,
+                    custom_data=["distance_start_km", "distance_end_km"],
+                    labels={"athlete": "Athlete"},
+                    text_auto=True)
+    figure.update_layout(xaxis_title_text="Distance (km)",
+                         yaxis_title_text="Number of races")
+    figure.update_traces(width=DISTANCE_BUCKET_KM,
+                         hovertemplate='<b>Distance</b>: %{customdata[0]} - %{customdata[1]} km <br>'
+                                       '<b>Number of races</b>: %{y} <br>')
+    return figure
+
+
+@profiled
+def plot_starting_points(df, route_store):
     """ Prepare and create the plot of starting points """
 
-    start_points_lat = df.apply(lambda row: row["route_points_lat"][0], axis=1)
-    start_points_lon = df.apply(lambda row: row["route_points_lon"][0], axis=1)
+    start_points_lat = route_store.first_rows("lat", df.index)
+    start_points_lon = route_store.first_rows("lon", df.index)
     start_points_lat_avg = start_points_lat.mean()
     start_points_lon_avg = start_points_lon.mean()
 
@@ -94,18 +197,23 @@ def plot_starting_points(df):
     return figure
 
 
-def plot_route(df, race_option_index):
+@profiled
+def plot_route(df, route_store, race_option_index):
     """ Prepare and create the plot of route """
 
-    lat = df["route_points_lat"][race_option_index]
-    lon = df["route_points_lon"][race_option_index]
-    elev = df["route_points_elev"][race_option_index]
-    dist_accum = df["route_points_dist_accum_km"][race_option_index]
-    dist_accum_percentage = df["route_points_dist_accum_percentage"][race_option_index]
-    duration_accum = df["route_points_duration_accum_timedelta_str"][race_option_index]
+    route = route_store.race(race_option_index)
+
+    # Plot only the points of the level of detail fitting in the point budget (start and end points included)
+    idx_points = select_route_points(route["rdp_importance_m"])
+    lat = route["lat"][idx_points]
+    lon = route["lon"][idx_points]
+    elev = route["elev"][idx_points]
+    dist_accum = route["dist_accum_km"][idx_points]
+    dist_accum_percentage = dist_accum * 100 / route["dist_accum_km"][-1]
+    duration_accum = format_duration_sec(route["duration_accum_sec"][idx_points])
 
-    avg_lat = sum(lat) / len(lat)
-    avg_lon = sum(lon) / len(lon)
+    avg_lat = route["lat"].mean()
+    avg_lon = route["lon"].mean()
 
     figure = px.line_map(lat=lat,
                          lon=lon)
@@ -148,15 +256,20 @@ def plot_route(df, race_option_index):
     return figure
 
 
-def plot_elevation(df, race_option_index):
+@profiled
+def plot_elevation(df, route_store, race_option_index):
     """ Prepare and create the plot of elevation """
 
-    lat = df["route_points_lat"][race_option_index]
-    lon = df["route_points_lon"][race_option_index]
-    elev = df["route_points_elev"][race_option_index]
-    dist_accum = df["route_points_dist_accum_km"][race_option_index]
-    dist_accum_percentage = df["route_points_dist_accum_percentage"][race_option_index]
-    duration_accum = df["route_points_duration_accum_timedelta_str"][race_option_index]
+    route = route_store.race(race_option_index)
+
+    # Plot only the points of the elevation profile fitting in the point budget (start and end points included)
+    idx_points = select_profile_points(route["dist_accum_km"], route["elev"])
+    lat = route["lat"][idx_points]
+    lon = route["lon"][idx_points]
+    elev = route["elev"][idx_points]
+    dist_accum = route["dist_accum_km"][idx_points]
+    dist_accum_percentage = dist_accum * 100 / route["dist_accum_km"][-1]
+    duration_accum = format_duration_sec(route["duration_accum_sec"][idx_points])
 
     figure = px.line(x=dist_accum,y=elev,
                      labels={"x": "Covered distance [km]", "y": "Elevation [m]"})
@@ -174,29 +287,24 @@ def plot_elevation(df, race_option_index):
     return figure
 
 
-def plot_pace(df, race_option_index):
-    pace_sec = df["pace_sec"][race_option_index]
-    pace_timedelta_str = df["pace_timedelta_str"][race_option_index]
-    pace_dist = df["pace_dist_km"][race_option_index]
-
-    delta_duration_sec = 20
-    min_duration = int(pace_sec.min())
-    max_duration = int(pace_sec.max())
-    duration_ticks = list(range(min_duration, max_duration, delta_duration_sec))
+@profiled
+def plot_pace(df, pace_store, race_option_index):
+    pace = pace_store.race(race_option_index)
+    pace_sec = pace["pace_sec"]
+    pace_timedelta_str = format_duration_sec(pace_sec)
+    pace_dist = pace["pace_dist_km"]
 
-    duration_labels = []
-    time_zero = datetime(2025, 1, 1)
-    for tick in duration_ticks:
-        duration_labels.append((time_zero + timedelta(seconds=tick)).strftime("%H:%M:%S"))
+    duration_ticks, duration_labels = get_duration_ticks(pace_sec.min(), pace_sec.max())
 
     figure = px.line(x=range(1, len(pace_sec)+1),
                      y=pace_sec,
-                     labels={"x": "Index of covered km", "y": "Pace"},
+                     labels={"x": "Index of split", "y": "Pace"},
                      markers=True)
     figure.update_traces(marker=dict(size=10),
-                         customdata=np.stack((pace_timedelta_str, pace_dist), axis=-1),
+                         customdata=np.stack((pace_timedelta_str, pace_dist, pace["split_end_km"]), axis=-1),
                          hovertemplate='<b>Pace</b>: %{customdata[0]} <br>'
-                                       '<b>Covered distance</b>: %{customdata[1]:.3f} km <br>')
+                                       '<b>Covered distance</b>: %{customdata[1]:.3f} km <br>'
+                                       '<b>Split end</b>: %{customdata[2]:.3f} km <br>')
     figure.update_layout(yaxis=dict(tickmode="array",
                                     tickvals=duration_ticks,
                                     ticktext=duration_labels))
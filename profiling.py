@@ -0,0 +1,189 @@
+from config import config
+from collections import deque
+from contextlib import contextmanager
+import contextvars
+import cProfile
+import functools
+import os
+import time
+import tracemalloc
+import uuid
+import pandas as pd
+
+
+def count_rows_and_points(values):
+    """ Return the number of rows of the first dataframe and the number of points of the first route store among the
+    given values (or None when there is no such value), looking into tuples too """
+
+    rows = None
+    points = None
+    for value in values:
+        items = value if isinstance(value, tuple) else (value,)
+        for item in items:
+            if rows is None and isinstance(item, pd.DataFrame):
+                rows = len(item)
+            elif points is None and hasattr(item, "offsets") and hasattr(item, "columns"):
+                points = int(item.offsets[-1])
+    return rows, points
+
+
+class Profiler:
+    """ Recorder of the wall time, CPU time, memory allocations (optionally, with tracemalloc) and processed rows and
+    points of the stages of the pipeline and of the plots, for the current rerun of the app and the previous ones """
+
+    def __init__(self, enabled, trace_memory, history_reruns, cprofile_dirpath):
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.cprofile_dirpath = cprofile_dirpath
+        self.history = deque(maxlen=history_reruns)  # records of the previous reruns
+        self.records = []  # records of the current rerun, in the order in which the stages are finished
+        self.stack = []  # stages which are currently running (the nested ones last)
+        self.stages_count = 0  # number of stages started in the current rerun
+        self.reruns_count = 0
+        self.rerun_start_time = None
+        self.cprofile = None
+        self.profiler_id = uuid.uuid4().hex[:8]  # distinguishes the cProfile statistics files of the sessions
+
+    def start_rerun(self):
+        """ Move the records of the previous rerun into the history and start recording a new rerun """
+
+        if not self.enabled:
+            return
+        self.end_rerun()
+        self.reruns_count += 1
+        self.records = []
+        self.stack = []
+        self.stages_count = 0
+        self.rerun_start_time = time.perf_counter()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.cprofile_dirpath:
+            self.cprofile = cProfile.Profile()
+            try:
+                self.cprofile.enable()
+            except ValueError:
+                # Only one cProfile profiler can be active at a time, the rerun of another session is being profiled
+                self.cprofile = None
+
+    def end_rerun(self):
+        """ Finish recording the current rerun: add it to the history and write its cProfile statistics """
+
+        if self.rerun_start_time is None:
+            return
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            os.makedirs(self.cprofile_dirpath, exist_ok=True)
+            self.cprofile.dump_stats(os.path.join(self.cprofile_dirpath,
+                                                  f"{self.profiler_id}_rerun_{self.reruns_count:05d}.prof"))
+            self.cprofile = None
+        self.history.append({"rerun": self.reruns_count,
+                             "wall_sec": time.perf_counter() - self.rerun_start_time,
+                             "records": self.records})
+        self.rerun_start_time = None
+
+    @contextmanager
+    def stage(self, name, rows=None, points=None):
+        """ Record a stage of the current rerun. The stages can be nested """
+
+        if not self.enabled:
+            yield {}
+            return
+
+        frame = {"name": name, "start_order": self.stages_count, "depth": len(self.stack), "rows": rows,
+                 "points": points}
+        self.stages_count += 1
+        if tracemalloc.is_tracing():
+            # The peak is reset for each stage, so it is passed on to the enclosing stage
+            current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+            if self.stack:
+                self.stack[-1]["peak_bytes"] = max(self.stack[-1]["peak_bytes"], peak_bytes)
+            tracemalloc.reset_peak()
+            frame["start_bytes"] = frame["peak_bytes"] = current_bytes
+        self.stack.append(frame)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+
+        try:
+            yield frame
+        finally:
+            record = {"stage": name,
+                      "start_order": frame["start_order"],
+                      "depth": frame["depth"],
+                      "wall_sec": time.perf_counter() - wall_start,
+                      "cpu_sec": time.process_time() - cpu_start,
+                      "alloc_net_bytes": None,
+                      "alloc_peak_bytes": None,
+                      "rows": frame["rows"],
+                      "points": frame["points"]}
+            self.stack.pop()
+            if "start_bytes" in frame and tracemalloc.is_tracing():
+                current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+                frame["peak_bytes"] = max(frame["peak_bytes"], peak_bytes)
+                record["alloc_net_bytes"] = current_bytes - frame["start_bytes"]
+                record["alloc_peak_bytes"] = frame["peak_bytes"] - frame["start_bytes"]
+                if self.stack:
+                    self.stack[-1]["peak_bytes"] = max(self.stack[-1]["peak_bytes"], frame["peak_bytes"])
+            self.records.append(record)
+
+    def get_records_table(self, records=None):
+        """ Return the records (of the current rerun by default) as a dataframe, in the order in which the stages
+        started, with the names of the nested stages indented """
+
+        records = pd.DataFrame(self.records if records is None else records,
+                               columns=["stage", "start_order", "depth", "wall_sec", "cpu_sec", "alloc_net_bytes",
+                                        "alloc_peak_bytes", "rows", "points"])
+        records = records.sort_values("start_order").astype({"rows": "Int64", "points": "Int64"})
+        records["stage"] = ["    " * depth + stage for stage, depth in zip(records["stage"], records["depth"])]
+        return records.drop(columns=["start_order", "depth"]).reset_index(drop=True)
+
+    def get_history_table(self):
+        """ Return a summary of the previous reruns: their total wall time and their slowest top-level stage """
+
+        rows = []
+        for rerun in reversed(self.history):
+            top_records = [record for record in rerun["records"] if record["depth"] == 0]
+            slowest = max(top_records, key=lambda record: record["wall_sec"], default=None)
+            rows.append({"rerun": rerun["rerun"],
+                         "wall_sec": rerun["wall_sec"],
+                         "stages_wall_sec": sum(record["wall_sec"] for record in top_records),
+                         "slowest_stage": slowest["stage"] if slowest else None,
+                         "slowest_stage_wall_sec": slowest["wall_sec"] if slowest else None})
+        return pd.DataFrame(rows, columns=["rerun", "wall_sec", "stages_wall_sec", "slowest_stage",
+                                           "slowest_stage_wall_sec"])
+
+
+def profiled(func=None, name=None):
+    """ Decorator recording each call of a function as a stage of the profiler, with the number of rows of its
+    dataframe and of points of its route store (taken from its arguments, or else from its result) """
+
+    if func is None:
+        return functools.partial(profiled, name=name)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profiler = current_profiler.get()
+        if not profiler.enabled:
+            return func(*args, **kwargs)
+        rows, points = count_rows_and_points(args)
+        with profiler.stage(name or func.__name__, rows, points) as frame:
+            result = func(*args, **kwargs)
+            result_rows, result_points = count_rows_and_points((result,))
+            frame["rows"] = rows if rows is not None else result_rows
+            frame["points"] = points if points is not None else result_points
+        return result
+
+    return wrapper
+
+
+def new_profiler():
+    """ Return a profiler configured from the configuration file (disabled unless enabled there) """
+
+    return Profiler(config["profiling_enabled"],
+                    config["profiling_trace_memory"],
+                    config["profiling_history_reruns"],
+                    config["profiling_cprofile_dirpath"])
+
+
+# Profiler recording the stages run in the current context (i.e. by the thread running the rerun of a session, see
+# main.py), a disabled one by default
+current_profiler = contextvars.ContextVar("current_profiler", default=Profiler(False, False, 1, None))
@@ -0,0 +1,56 @@
+from profiling import profiled
+import numpy as np
+
+# Periods over which the races are aggregated (pandas period frequencies)
+AGGREGATION_PERIODS = {"Week": "W", "Month": "M"}
+
+# Quantiles of the time per km computed for each period: the outer and inner bands and the median
+AGGREGATION_QUANTILES = {"p10": 0.1, "p25": 0.25, "median": 0.5, "p75": 0.75, "p90": 0.9}
+
+# Width (km) of the buckets of distances in which the races are counted
+DISTANCE_BUCKET_KM = 1.0
+
+
+def filter_races_by_distance(df, race_distance_option):
+    """ Return the races of the selected category of distances """
+
+    match race_distance_option:
+        case "5 & 6 km":
+            df = df.loc[df["distance"].isin([5, 6])]
+        case "10 km":
+            df = df.loc[df["distance"] == 10]
+    return df
+
+
+@profiled
+def aggregate_time_per_km(df, race_distance_option, period_option):
+    """ Aggregate the time per km of the races of the selected category of distances per athlete and period (week or
+    month). Return a dataframe with, for each athlete and period having races, the athlete, the start date of the
+    period, its number of races and the minimum, maximum and quantiles of their time per km (in seconds) """
+
+    df = filter_races_by_distance(df, race_distance_option)
+    period_start = df["date"].dt.to_period(AGGREGATION_PERIODS[period_option]).dt.start_time
+    groups = df["duration_km_sec"].groupby([df["athlete"].to_numpy(), period_start.to_numpy()])
+
+    aggregates = groups.agg(["count", "min", "max"])
+    quantiles = (groups.quantile(list(AGGREGATION_QUANTILES.values()))
+                 .unstack()
+                 .reindex(index=aggregates.index, columns=list(AGGREGATION_QUANTILES.values())))
+    aggregates[list(AGGREGATION_QUANTILES)] = quantiles.to_numpy()
+
+    return aggregates.rename_axis(["athlete", "period_start"]).reset_index()
+
+
+@profiled
+def count_races_per_distance(df):
+    """ Return the number of races of each athlete per bucket of distances (of DISTANCE_BUCKET_KM, so that the races
+    with slightly different distances are counted together), with the start and end distance of each bucket, sorted by
+    distance """
+
+    distance_start_km = np.floor(df["distance"].to_numpy() / DISTANCE_BUCKET_KM) * DISTANCE_BUCKET_KM
+    distance_counts = (df.groupby([distance_start_km, df["athlete"].to_numpy()], sort=True).size()
+                       .rename("races_count")
+                       .rename_axis(["distance_start_km", "athlete"])
+                       .reset_index())
+    distance_counts.insert(1, "distance_end_km", distance_counts["distance_start_km"] + DISTANCE_BUCKET_KM)
+    return distance_counts
@@ -0,0 +1,130 @@
+from config import config
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+
+# Bump when the layout of the cached route arrays changes, so that older entries are not reused
+CACHE_FORMAT_VERSION = 5
+
+
+# Name of the file of the cache folder mapping the .GPX files to the hash of their contents
+TRACK_ID_INDEX_FILENAME = "track_ids.json"
+
+
+def get_cache_key(track_id):
+    """ Build the cache key of a .GPX file from the hash of its contents, so that the identical files (e.g. of several
+    athletes) share the same entry """
+
+    key_data = f"{CACHE_FORMAT_VERSION}|{track_id}"
+    return hashlib.sha1(key_data.encode("utf-8")).hexdigest()
+
+
+def get_cache_entry_filepath(key):
+    """ Return the path of the cache entry with the given key """
+
+    return os.path.join(config["route_cache_dirpath"], key + ".npy")
+
+
+def is_cache_enabled():
+    """ Check if the route cache is enabled in the configuration file """
+
+    return bool(config.get("route_cache_dirpath"))
+
+
+def load_cached_route(track_id):
+    """ Return the cached route array of a .GPX file, given the hash of its contents (memory-mapped, read-only), or
+    None if it is not cached """
+
+    if not is_cache_enabled():
+        return None
+
+    entry_filepath = get_cache_entry_filepath(get_cache_key(track_id))
+    try:
+        route = np.load(entry_filepath, mmap_mode="r")
+    except (FileNotFoundError, ValueError, OSError):
+        return None
+
+    # Refresh the modification time so that the eviction drops the least recently used entries first
+    os.utime(entry_filepath)
+    return route
+
+
+def store_cached_route(track_id, route):
+    """ Store the route array of a .GPX file, given the hash of its contents, in the cache. The size limit of the cache
+    is not checked here, but once per batch of stored routes (see enforce_cache_size_limit) """
+
+    if not is_cache_enabled():
+        return
+
+    os.makedirs(config["route_cache_dirpath"], exist_ok=True)
+    entry_filepath = get_cache_entry_filepath(get_cache_key(track_id))
+    tmp_filepath = f"{entry_filepath}.{os.getpid()}.tmp"
+    with open(tmp_filepath, "wb") as tmp_file:
+        np.save(tmp_file, route)
+    os.replace(tmp_filepath, entry_filepath)
+
+
+def enforce_cache_size_limit():
+    """ Evict the least recently used cache entries if the cache is bigger than the size set in the configuration
+    file """
+
+    if is_cache_enabled() and os.path.isdir(config["route_cache_dirpath"]):
+        evict_cached_routes(config["route_cache_max_size_mb"] * 1024 * 1024)
+
+
+def evict_cached_routes(max_size_bytes):
+    """ Delete the least recently used cache entries until the size of the cache is below the given limit """
+
+    entries = []
+    with os.scandir(config["route_cache_dirpath"]) as dir_entries:
+        for dir_entry in dir_entries:
+            if dir_entry.name.endswith(".npy"):
+                entry_stat = dir_entry.stat()
+                entries.append((entry_stat.st_mtime_ns, entry_stat.st_size, dir_entry.path))
+
+    cache_size_bytes = sum(entry[1] for entry in entries)
+    for _, entry_size_bytes, entry_filepath in sorted(entries):
+        if cache_size_bytes <= max_size_bytes:
+            break
+        try:
+            os.remove(entry_filepath)
+        except OSError:
+            continue
+        cache_size_bytes -= entry_size_bytes
+
+
+def clear_cached_routes():
+    """ Delete all the entries of the route cache """
+
+    if is_cache_enabled() and os.path.isdir(config["route_cache_dirpath"]):
+        evict_cached_routes(0)
+
+
+def load_track_id_index():
+    """ Return the index of the .GPX files stored in the cache folder: a dict mapping the path of each file to its size,
+    modification time and content hash (empty if there is no index) """
+
+    if not is_cache_enabled():
+        return {}
+
+    try:
+        with open(os.path.join(config["route_cache_dirpath"], TRACK_ID_INDEX_FILENAME), "r") as index_file:
+            index = json.load(index_file)
+    except (OSError, ValueError):
+        return {}
+    return index["files"] if index.get("version") == CACHE_FORMAT_VERSION else {}
+
+
+def store_track_id_index(files):
+    """ Store the index of the .GPX files (see load_track_id_index) in the cache folder """
+
+    if not is_cache_enabled():
+        return
+
+    os.makedirs(config["route_cache_dirpath"], exist_ok=True)
+    tmp_fd, tmp_filepath = tempfile.mkstemp(suffix=".tmp", dir=config["route_cache_dirpath"])
+    with os.fdopen(tmp_fd, "w") as tmp_file:
+        json.dump({"version": CACHE_FORMAT_VERSION, "files": files}, tmp_file)
+    os.replace(tmp_filepath, os.path.join(config["route_cache_dirpath"], TRACK_ID_INDEX_FILENAME))
@@ -0,0 +1,124 @@
+from config import config
+import heapq
+import numpy as np
+
+# Tolerances (in meters) of the precomputed levels of detail of the route polylines, from the finest to the coarsest
+RDP_TOLERANCES_M = (0.5, 1, 2, 5, 10, 20, 50, 100)
+
+# Maximum number of points ranked by the Ramer-Douglas-Peucker algorithm for each route (the remaining points are only
+# needed for point budgets above this value)
+RDP_MAX_RANKED_POINTS = 10000
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def project_to_local_meters(lat, lon):
+    """ Project latitude and longitude values on a local plane (equirectangular projection), in meters """
+
+    lat_rad = np.radians(lat)
+    lon_rad = np.radians(lon)
+    x = EARTH_RADIUS_M * lon_rad * np.cos(np.mean(lat_rad))
+    y = EARTH_RADIUS_M * lat_rad
+    return x, y
+
+
+def get_farthest_point(x, y, idx_start, idx_end):
+    """ Return the index of the point between the given ones which is the farthest from the segment connecting them,
+    and its distance to the segment """
+
+    seg_x = x[idx_end] - x[idx_start]
+    seg_y = y[idx_end] - y[idx_start]
+    points_x = x[idx_start + 1:idx_end] - x[idx_start]
+    points_y = y[idx_start + 1:idx_end] - y[idx_start]
+
+    seg_length = np.hypot(seg_x, seg_y)
+    if seg_length > 0:
+        dist = np.abs(seg_x * points_y - seg_y * points_x) / seg_length
+    else:
+        dist = np.hypot(points_x, points_y)
+
+    idx_max = int(np.argmax(dist))
+    return idx_start + 1 + idx_max, float(dist[idx_max])
+
+
+def compute_rdp_importance(lat, lon, max_ranked_points=RDP_MAX_RANKED_POINTS):
+    """ Rank the points of a route with the Ramer-Douglas-Peucker algorithm. The importance of a point is the largest
+    tolerance (in meters) for which the algorithm keeps it, so the simplified route for any tolerance is given by the
+    points whose importance is above it. The start and end points have an infinite importance """
+
+    x, y = project_to_local_meters(lat, lon)
+    importance = np.zeros(len(x), dtype=np.float32)
+    if len(x) == 0:
+        return importance
+    importance[0] = importance[-1] = np.inf
+
+    # Split the segments in the order of decreasing importance, so that the most important points are ranked first
+    segments = []
+
+    def push_segment(idx_start, idx_end, importance_parent):
+        if idx_end - idx_start > 1:
+            idx_farthest, dist = get_farthest_point(x, y, idx_start, idx_end)
+            heapq.heappush(segments, (-min(dist, importance_parent), idx_farthest, idx_start, idx_end))
+
+    push_segment(0, len(x) - 1, np.inf)
+    ranked_points = 2
+    while segments and ranked_points < max_ranked_points:
+        negative_importance, idx_farthest, idx_start, idx_end = heapq.heappop(segments)
+        importance[idx_farthest] = -negative_importance
+        ranked_points += 1
+        push_segment(idx_start, idx_farthest, -negative_importance)
+        push_segment(idx_farthest, idx_end, -negative_importance)
+
+    return importance
+
+
+def select_route_points(importance, point_budget=None):
+    """ Return the indices of the points of the finest precomputed level of detail of a route which fits in the point
+    budget (taken from the configuration file if not given) """
+
+    point_budget = min(point_budget or config["plot_point_budget"], RDP_MAX_RANKED_POINTS)
+    if len(importance) <= point_budget:
+        return np.arange(len(importance))
+
+    for tolerance_m in RDP_TOLERANCES_M:
+        idx = np.flatnonzero(importance > tolerance_m)
+        if len(idx) <= point_budget:
+            return idx
+
+    # Even the coarsest level is above the budget: keep the most important points
+    return np.sort(np.argpartition(importance, -point_budget)[-point_budget:])
+
+
+def select_profile_points(x, y, point_budget=None):
+    """ Return the indices of the points of a profile (e.g. elevation w.r.t. distance) selected with the
+    largest-triangle-three-buckets algorithm, keeping the first and last points """
+
+    point_budget = max(point_budget or config["plot_point_budget"], 3)
+    if len(x) <= point_budget:
+        return np.arange(len(x))
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    bucket_edges = np.linspace(1, len(x) - 1, point_budget - 1).astype(np.int64)
+
+    idx = np.empty(point_budget, dtype=np.int64)
+    idx[0] = 0
+    idx[-1] = len(x) - 1
+    for idx_bucket in range(point_budget - 2):
+        bucket_start, bucket_end = bucket_edges[idx_bucket], bucket_edges[idx_bucket + 1]
+        if idx_bucket + 2 < len(bucket_edges):
+            next_start, next_end = bucket_end, bucket_edges[idx_bucket + 2]
+        else:
+            next_start, next_end = len(x) - 1, len(x)
+        next_x = x[next_start:next_end].mean()
+        next_y = y[next_start:next_end].mean()
+
+        # Keep the point of the bucket which forms the largest triangle with the previous kept point and the average
+        # point of the next bucket
+        prev_x = x[idx[idx_bucket]]
+        prev_y = y[idx[idx_bucket]]
+        area = np.abs((prev_x - next_x) * (y[bucket_start:bucket_end] - prev_y) -
+                      (prev_x - x[bucket_start:bucket_end]) * (next_y - prev_y))
+        idx[idx_bucket + 1] = bucket_start + int(np.argmax(area))
+
+    return idx
@@ -0,0 +1,254 @@
+import os
+import numpy as np
+
+
+class RouteStore:
+    """ Flat, columnar table holding the rows (e.g. route points) of all the tracks contiguously, together with an
+    offsets index giving the range of rows of each track and the track of each race. Several races can share the same
+    track (e.g. identical .GPX files of several athletes), which is then stored only once """
+
+    def __init__(self, race_ids, columns, offsets, race_tracks=None, track_ids=None):
+        self.race_ids = np.asarray(race_ids)
+        self.columns = columns
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        # Position of the track of each race (by default, each race has its own track, in the same order)
+        self.race_tracks = (np.arange(len(self.race_ids)) if race_tracks is None
+                            else np.asarray(race_tracks, dtype=np.int64))
+        # Key of each track (e.g. hash of the contents of its .GPX file), used for sharing the tracks between stores
+        self.track_ids = None if track_ids is None else np.asarray(track_ids)
+        self.race_positions = {race_id: position for position, race_id in enumerate(self.race_ids.tolist())}
+
+    @classmethod
+    def from_arrays(cls, race_ids, arrays, fields=None, race_tracks=None, track_ids=None, dtype=None):
+        """ Build the store from one structured array (or dict of arrays) per track, copying each of the given fields
+        (all the fields of the structured arrays by default) into a single contiguous column. The structured dtype of
+        the arrays gives the fields and the column types of a store built without any array """
+
+        if fields is None:
+            fields = dtype.names if dtype is not None else arrays[0].dtype.names if arrays else ()
+
+        offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+        if arrays and fields:
+            offsets[1:] = np.cumsum([len(array[fields[0]]) for array in arrays])
+        if arrays:
+            columns = {field: np.concatenate([array[field] for array in arrays]) for field in fields}
+        else:
+            columns = {field: np.empty(0, dtype=dtype[field] if dtype is not None else np.float64) for field in fields}
+
+        return cls(race_ids, columns, offsets, race_tracks, track_ids)
+
+    def __len__(self):
+        """ Return the number of races """
+
+        return len(self.race_ids)
+
+    @property
+    def tracks_count(self):
+        """ Return the number of tracks """
+
+        return len(self.offsets) - 1
+
+    @property
+    def nbytes(self):
+        """ Return the memory used by the columns, the offsets index and the tracks of the races """
+
+        return (sum(column.nbytes for column in self.columns.values()) + self.offsets.nbytes +
+                self.race_tracks.nbytes)
+
+    @property
+    def track_lengths(self):
+        """ Return the number of rows of each track """
+
+        return np.diff(self.offsets)
+
+    @property
+    def lengths(self):
+        """ Return the number of rows of each race """
+
+        return self.track_lengths[self.race_tracks]
+
+    def race_slice(self, race_id):
+        """ Return the slice of the rows of a race """
+
+        track = self.race_tracks[self.race_positions[race_id]]
+        return slice(self.offsets[track], self.offsets[track + 1])
+
+    def race(self, race_id):
+        """ Return the columns of a race as zero-copy views """
+
+        race_slice = self.race_slice(race_id)
+        return {field: column[race_slice] for field, column in self.columns.items()}
+
+    def column(self, field):
+        """ Return a whole column (all the races) """
+
+        return self.columns[field]
+
+    def row_tracks(self):
+        """ Return the position of the track of each row """
+
+        return np.repeat(np.arange(self.tracks_count), self.track_lengths)
+
+    def first_rows(self, field, race_ids=None):
+        """ Return the value of the given field in the first row of each race (of the given races if provided) """
+
+        return self.columns[field][self.offsets[:-1][self.race_tracks[self.get_positions(race_ids)]]]
+
+    def last_rows(self, field, race_ids=None):
+        """ Return the value of the given field in the last row of each race (of the given races if provided) """
+
+        return self.columns[field][self.offsets[1:][self.race_tracks[self.get_positions(race_ids)]] - 1]
+
+    def interpolate(self, field, x_field, tracks, x):
+        """ Return the values of a field at the given values of another field (non-decreasing within each track, e.g.
+        the cumulative distance), each one in the track at the given position. A value is interpolated linearly between
+        the last row of the track below it and the first row reaching it, so that when several rows have the same
+        value (e.g. the GPS device standing still), the first of them is used. The values outside the range of a track
+        take the value of its first or last row """
+
+        x_column = self.columns[x_field]
+        y_column = self.columns[field].astype(np.float64)
+        tracks = np.asarray(tracks, dtype=np.int64)
+        track_starts = self.offsets[:-1]
+        track_ends = np.maximum(self.offsets[1:] - 1, track_starts)
+        if len(x_column) == 0:
+            return np.zeros(len(tracks))
+
+        # Shift the values of each track by a different offset, so that the values of all the tracks form a single
+        # non-decreasing sequence and all the rows can be searched at once
+        x_first = x_column[np.minimum(track_starts, len(x_column) - 1)]
+        x_last = x_column[track_ends]
+        track_shift = (np.max(x_last - x_first, initial=0) + 1) * np.arange(self.tracks_count) - x_first
+        x = np.clip(np.asarray(x, dtype=np.float64), x_first[tracks], x_last[tracks])
+        hi = np.searchsorted(x_column + np.repeat(track_shift, self.track_lengths), x + track_shift[tracks],
+                             side="left")
+        hi = np.clip(hi, track_starts[tracks], track_ends[tracks])
+        lo = np.maximum(hi - 1, track_starts[tracks])
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fraction = np.where(hi > lo, (x - x_column[lo]) / (x_column[hi] - x_column[lo]), 1)
+        return y_column[lo] + (y_column[hi] - y_column[lo]) * np.clip(fraction, 0, 1)
+
+    def get_positions(self, race_ids=None):
+        """ Return the positions in the store of the given races (of all the races if not provided) """
+
+        if race_ids is None:
+            return np.arange(len(self.race_ids))
+        return np.array([self.race_positions[race_id] for race_id in race_ids], dtype=np.int64)
+
+    def select(self, race_ids, new_race_ids=None):
+        """ Return a new store with the given races, in the given order (optionally renaming them), holding only the
+        rows of their tracks """
+
+        tracks, race_tracks = np.unique(self.race_tracks[self.get_positions(race_ids)], return_inverse=True)
+        return self.select_tracks(tracks, race_ids if new_race_ids is None else new_race_ids, race_tracks)
+
+    def select_tracks(self, tracks, race_ids, race_tracks):
+        """ Return a new store with the rows of the tracks at the given positions and the given races (with the
+        positions of their tracks among the selected ones) """
+
+        lengths = self.track_lengths[tracks]
+        offsets = np.zeros(len(tracks) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(lengths)
+        row_idx = np.repeat(self.offsets[:-1][tracks] - offsets[:-1], lengths) + np.arange(offsets[-1])
+
+        return RouteStore(race_ids,
+                          {field: column[row_idx] for field, column in self.columns.items()},
+                          offsets,
+                          race_tracks,
+                          None if self.track_ids is None else self.track_ids[tracks])
+
+    def with_races(self, race_ids, new_race_ids=None):
+        """ Return a store sharing the rows of this one (without copying them) with the given races, in the given order
+        (optionally renaming them). The tracks of the other races are kept """
+
+        return RouteStore(race_ids if new_race_ids is None else new_race_ids,
+                          self.columns,
+                          self.offsets,
+                          self.race_tracks[self.get_positions(race_ids)],
+                          self.track_ids)
+
+    @classmethod
+    def concatenate(cls, stores):
+        """ Return a new store with the races of all the given stores (which shall have the same fields), holding only
+        the rows of their tracks, copied once. If all the tracks have a key, the tracks with the same key are kept only
+        once """
+
+        has_track_ids = all(store.track_ids is not None for store in stores)
+
+        # Tracks kept from each store (the ones of its races, without the keys already kept) and their new positions
+        kept_track_ids = {}
+        kept_tracks = []
+        race_tracks = []
+        tracks_count = 0
+        for store in stores:
+            tracks, store_race_tracks = np.unique(store.race_tracks, return_inverse=True)
+            new_positions = np.empty(len(tracks), dtype=np.int64)
+            is_kept = np.ones(len(tracks), dtype=bool)
+            for idx, track in enumerate(tracks.tolist()):
+                track_id = store.track_ids[track] if has_track_ids else None
+                if track_id is not None and track_id in kept_track_ids:
+                    new_positions[idx] = kept_track_ids[track_id]
+                    is_kept[idx] = False
+                else:
+                    new_positions[idx] = tracks_count
+                    tracks_count += 1
+                    if track_id is not None:
+                        kept_track_ids[track_id] = new_positions[idx]
+            kept_tracks.append(tracks[is_kept])
+            race_tracks.append(new_positions[store_race_tracks])
+
+        lengths = np.concatenate([store.track_lengths[tracks] for store, tracks in zip(stores, kept_tracks)])
+        offsets = np.zeros(tracks_count + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(lengths)
+
+        # Each column is allocated once and filled with the rows of the kept tracks of each store
+        columns = {field: np.empty(offsets[-1], dtype=column.dtype) for field, column in stores[0].columns.items()}
+        start = 0
+        for store, tracks in zip(stores, kept_tracks):
+            track_lengths = store.track_lengths[tracks]
+            end = start + int(track_lengths.sum())
+            if np.array_equal(tracks, np.arange(store.tracks_count)):
+                for field, column in columns.items():
+                    column[start:end] = store.columns[field]
+            else:
+                row_idx = (np.repeat(store.offsets[:-1][tracks] - np.cumsum(track_lengths) + track_lengths,
+                                     track_lengths) + np.arange(end - start))
+                for field, column in columns.items():
+                    np.take(store.columns[field], row_idx, out=column[start:end])
+            start = end
+
+        return cls(np.concatenate([store.race_ids for store in stores]),
+                   columns,
+                   offsets,
+                   np.concatenate(race_tracks),
+                   np.concatenate([store.track_ids[tracks] for store, tracks in zip(stores, kept_tracks)])
+                   if has_track_ids else None)
+
+    def save(self, dirpath):
+        """ Save the store in a folder, as one .npy file per column """
+
+        os.makedirs(dirpath, exist_ok=True)
+        np.save(os.path.join(dirpath, "race_ids.npy"), self.race_ids)
+        np.save(os.path.join(dirpath, "offsets.npy"), self.offsets)
+        np.save(os.path.join(dirpath, "race_tracks.npy"), self.race_tracks)
+        if self.track_ids is not None:
+            np.save(os.path.join(dirpath, "track_ids.npy"), self.track_ids)
+        for field, column in self.columns.items():
+            np.save(os.path.join(dirpath, f"column_{field}.npy"), column)
+
+    @classmethod
+    def load(cls, dirpath):
+        """ Load a store saved with save, memory-mapping its columns """
+
+        columns = {}
+        for filename in sorted(os.listdir(dirpath)):
+            if filename.startswith("column_") and filename.endswith(".npy"):
+                columns[filename[len("column_"):-len(".npy")]] = np.load(os.path.join(dirpath, filename), mmap_mode="r")
+        track_ids_filepath = os.path.join(dirpath, "track_ids.npy")
+
+        return cls(np.load(os.path.join(dirpath, "race_ids.npy")),
+                   columns,
+                   np.load(os.path.join(dirpath, "offsets.npy")),
+                   np.load(os.path.join(dirpath, "race_tracks.npy")),
+                   np.load(track_ids_filepath) if os.path.isfile(track_ids_filepath) else None)
@@ -0,0 +1,161 @@
+from route_simplification import EARTH_RADIUS_M
+from profiling import profiled
+import numpy as np
+import pandas as pd
+
+# Offset added to the grid column index before combining it with the grid row index into a single cell key
+CELL_KEY_SHIFT = 1 << 30
+
+
+class SpatialIndex:
+    """ Uniform grid over the route points of all the tracks (projected on a plane, in meters), for finding the points
+    within a given distance of other points without scanning all the routes. The results are computed per track and
+    then given for each race of the track """
+
+    @profiled(name="SpatialIndex")
+    def __init__(self, route_store, cell_size_m):
+        self.route_store = route_store
+        self.cell_size_m = cell_size_m
+        self.lat_ref_rad = np.radians(np.mean(route_store.column("lat"))) if route_store.offsets[-1] else 0.0
+        self.point_tracks = route_store.row_tracks()
+        self.race_tracks = pd.Series(route_store.race_tracks, index=pd.Index(route_store.race_ids, name="race_id"),
+                                     name="track")
+        self.x, self.y = self.project(route_store.column("lat"), route_store.column("lon"))
+
+        # Points sorted by cell, with the range of points of each non-empty cell
+        point_keys = self.get_cell_keys(self.x, self.y)
+        self.sorted_points = np.argsort(point_keys, kind="stable")
+        self.cell_keys, self.cell_starts, self.cell_counts = np.unique(point_keys[self.sorted_points],
+                                                                       return_index=True, return_counts=True)
+
+    @property
+    def nbytes(self):
+        """ Return the memory used by the projected points and the grid (the route store being shared with the
+        dataset) """
+
+        return (self.x.nbytes + self.y.nbytes + self.sorted_points.nbytes + self.point_tracks.nbytes +
+                self.cell_keys.nbytes + self.cell_starts.nbytes + self.cell_counts.nbytes)
+
+    def project(self, lat, lon):
+        """ Project latitude and longitude values on the plane of the index (equirectangular projection), in meters """
+
+        x = EARTH_RADIUS_M * np.radians(lon) * np.cos(self.lat_ref_rad)
+        y = EARTH_RADIUS_M * np.radians(lat)
+        return x, y
+
+    def get_cell_keys(self, x, y, offset_x=0, offset_y=0):
+        """ Return the key of the grid cell of each point (optionally of the cell at the given offset from it) """
+
+        cell_x = np.floor(x / self.cell_size_m).astype(np.int64) + offset_x
+        cell_y = np.floor(y / self.cell_size_m).astype(np.int64) + offset_y
+        return (cell_x + CELL_KEY_SHIFT) * (2 * CELL_KEY_SHIFT) + cell_y
+
+    def query_points(self, lat, lon, radius_m):
+        """ Find all the indexed points within the radius of each of the given points. Return the index of the query
+        point, the index of the route point (in the route store) and their distance for each found pair """
+
+        query_x, query_y = self.project(np.atleast_1d(lat), np.atleast_1d(lon))
+        cells_range = int(np.ceil(radius_m / self.cell_size_m))
+
+        # Ranges of points of the cells around each query point
+        query_idx = []
+        range_starts = []
+        range_counts = []
+        for offset_x in range(-cells_range, cells_range + 1):
+            for offset_y in range(-cells_range, cells_range + 1):
+                keys = self.get_cell_keys(query_x, query_y, offset_x, offset_y)
+                cell_idx = np.minimum(np.searchsorted(self.cell_keys, keys), len(self.cell_keys) - 1)
+                is_found = self.cell_keys[cell_idx] == keys
+                query_idx.append(np.flatnonzero(is_found))
+                range_starts.append(self.cell_starts[cell_idx[is_found]])
+                range_counts.append(self.cell_counts[cell_idx[is_found]])
+        query_idx = np.concatenate(query_idx)
+        range_starts = np.concatenate(range_starts)
+        range_counts = np.concatenate(range_counts)
+
+        # Expand the ranges into candidate pairs and keep the ones within the radius
+        range_offsets = np.cumsum(range_counts) - range_counts
+        candidate_query_idx = np.repeat(query_idx, range_counts)
+        candidate_sorted_idx = (np.repeat(range_starts - range_offsets, range_counts) +
+                                np.arange(range_counts.sum(), dtype=np.int64))
+        candidate_point_idx = self.sorted_points[candidate_sorted_idx]
+        dist_m = np.hypot(self.x[candidate_point_idx] - query_x[candidate_query_idx],
+                          self.y[candidate_point_idx] - query_y[candidate_query_idx])
+        is_near = dist_m <= radius_m
+
+        return candidate_query_idx[is_near], candidate_point_idx[is_near], dist_m[is_near]
+
+    def get_race_values(self, track_values):
+        """ Return the values computed per track (indexed by track position) for each race of the tracks, indexed by
+        race id """
+
+        return self.race_tracks.to_frame().join(track_values, on="track", how="inner").drop(columns="track")
+
+    def races_near(self, lat, lon, radius_m):
+        """ Return the races passing within the radius of a point, with their minimum distance to it (in meters),
+        from the closest to the farthest """
+
+        _, point_idx, dist_m = self.query_points(lat, lon, radius_m)
+        tracks = (pd.DataFrame({"track": self.point_tracks[point_idx], "min_dist_m": dist_m})
+                  .groupby("track")["min_dist_m"].min())
+        return self.get_race_values(tracks.to_frame()).sort_values("min_dist_m", kind="stable")
+
+    def sample_route(self, race_id, start_km=0.0, end_km=np.inf):
+        """ Return the indices (in the route store) of points of a race spaced by about the cell size, between the
+        given distances """
+
+        route_slice = self.route_store.race_slice(race_id)
+        dist_accum_km = self.route_store.column("dist_accum_km")[route_slice]
+        marks_km = np.arange(max(start_km, 0.0), min(end_km, dist_accum_km[-1]), self.cell_size_m / 1000)
+        idx = np.unique(np.minimum(np.searchsorted(dist_accum_km, marks_km), len(dist_accum_km) - 1))
+        return route_slice.start + idx
+
+    def races_sharing_route(self, race_id, radius_m, min_shared_fraction):
+        """ Return the other races passing within the radius of at least the given fraction of the points sampled
+        along the route of a race, with the shared fraction, from the most to the least shared """
+
+        sample_idx = self.sample_route(race_id)
+        query_idx, point_idx, _ = self.query_points(self.route_store.column("lat")[sample_idx],
+                                                    self.route_store.column("lon")[sample_idx],
+                                                    radius_m)
+        pairs = pd.DataFrame({"track": self.point_tracks[point_idx], "query_idx": query_idx}).drop_duplicates()
+        shared_fraction = pairs.groupby("track")["query_idx"].count() / len(sample_idx)
+
+        tracks = shared_fraction.loc[shared_fraction >= min_shared_fraction].rename("shared_fraction").to_frame()
+        races = self.get_race_values(tracks).drop(index=race_id, errors="ignore")
+        return races.sort_values("shared_fraction", ascending=False, kind="stable")
+
+    def fastest_on_segment(self, race_id, start_km, end_km, radius_m, max_length_deviation=0.2):
+        """ Return the time needed by each race (including the given one) for covering the segment of the route of a
+        race between the given distances, from the fastest to the slowest. A race covers the segment if it passes
+        within the radius of its start and then of its end point, with a covered distance in between which differs
+        from the segment length by at most the given fraction """
+
+        route_slice = self.route_store.race_slice(race_id)
+        dist_accum_km = self.route_store.column("dist_accum_km")
+        lat = np.interp([start_km, end_km], dist_accum_km[route_slice], self.route_store.column("lat")[route_slice])
+        lon = np.interp([start_km, end_km], dist_accum_km[route_slice], self.route_store.column("lon")[route_slice])
+        segment_length_km = end_km - start_km
+
+        # Point of each track which is the closest to the start and to the end of the segment
+        query_idx, point_idx, dist_m = self.query_points(lat, lon, radius_m)
+        closest = (pd.DataFrame({"track": self.point_tracks[point_idx], "query_idx": query_idx,
+                                 "point_idx": point_idx, "dist_m": dist_m})
+                   .sort_values("dist_m")
+                   .drop_duplicates(["track", "query_idx"])
+                   .pivot(index="track", columns="query_idx", values="point_idx")
+                   .reindex(columns=[0, 1])
+                   .dropna())
+        if closest.empty:
+            return pd.DataFrame(columns=["segment_duration_sec", "segment_dist_km"])
+        idx_start = closest[0].to_numpy(dtype=np.int64)
+        idx_end = closest[1].to_numpy(dtype=np.int64)
+
+        duration_accum_sec = self.route_store.column("duration_accum_sec")
+        efforts = pd.DataFrame({"segment_duration_sec": duration_accum_sec[idx_end] - duration_accum_sec[idx_start],
+                                "segment_dist_km": dist_accum_km[idx_end] - dist_accum_km[idx_start]},
+                               index=closest.index)
+        is_valid = ((idx_end > idx_start) &
+                    (np.abs(efforts["segment_dist_km"] - segment_length_km) <=
+                     max_length_deviation * segment_length_km))
+        return self.get_race_values(efforts.loc[is_valid]).sort_values("segment_duration_sec", kind="stable")
@@ -0,0 +1,21 @@
+import os
+import sys
+import pytest
+
+# The modules of the WebApp are not packaged and read config.json from the current folder
+REPO_DIRPATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIRPATH)
+os.chdir(REPO_DIRPATH)
+
+from config import config
+
+
+@pytest.fixture(autouse=True)
+def isolated_config(tmp_path, monkeypatch):
+    """ Keep the caches and stored datasets of the tests in a temporary folder and load the routes sequentially """
+
+    monkeypatch.setitem(config, "route_cache_dirpath", str(tmp_path / "route_cache"))
+    monkeypatch.setitem(config, "dataset_dirpath", str(tmp_path / "processed_dataset"))
+    monkeypatch.setitem(config, "bundle_dirpath", str(tmp_path / "bundle"))
+    monkeypatch.setitem(config, "route_loading_workers", 1)
+    return config
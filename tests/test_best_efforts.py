@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+from best_efforts import compute_best_efforts
+from route_store import RouteStore
+
+
+def get_brute_force_best_effort(dist_accum_km, duration_accum_sec, distance_km):
+    """ Return the duration of the fastest window covering the distance, searched over a dense grid of window starts
+    which includes the starts and ends at every route point (where the fastest window is) """
+
+    starts_km = np.concatenate([np.linspace(0, dist_accum_km[-1], 20001), dist_accum_km, dist_accum_km - distance_km])
+    starts_km = starts_km[(starts_km >= 0) & (starts_km + distance_km <= dist_accum_km[-1])]
+    if len(starts_km) == 0:
+        return None
+    durations_sec = (np.interp(starts_km + distance_km, dist_accum_km, duration_accum_sec) -
+                     np.interp(starts_km, dist_accum_km, duration_accum_sec))
+    return durations_sec.min()
+
+
+def test_best_efforts_match_brute_force():
+    rng = np.random.default_rng(0)
+    routes = []
+    for points_count in [50, 200, 3]:
+        dist_accum_km = np.concatenate([[0], np.cumsum(rng.uniform(0.001, 0.1, points_count - 1))])
+        duration_accum_sec = np.concatenate([[0], np.cumsum(rng.integers(1, 60, points_count - 1))])
+        routes.append({"dist_accum_km": dist_accum_km, "duration_accum_sec": duration_accum_sec})
+    route_store = RouteStore.from_arrays(["A", "B", "C"], routes, fields=["dist_accum_km", "duration_accum_sec"])
+    distances_km = [0.25, 1.0, 5.0]
+
+    efforts = compute_best_efforts(route_store, distances_km).set_index(["race_id", "distance_km"])
+
+    for race_id, route in zip(route_store.race_ids, routes):
+        for distance_km in distances_km:
+            duration_sec = get_brute_force_best_effort(route["dist_accum_km"], route["duration_accum_sec"],
+                                                       distance_km)
+            if duration_sec is None:
+                assert (race_id, distance_km) not in efforts.index
+                continue
+            effort = efforts.loc[(race_id, distance_km)]
+            assert effort["duration_sec"] == pytest.approx(duration_sec)
+            start_km = effort["start_km"]
+            assert effort["duration_sec"] == pytest.approx(
+                np.interp(start_km + distance_km, route["dist_accum_km"], route["duration_accum_sec"]) -
+                np.interp(start_km, route["dist_accum_km"], route["duration_accum_sec"]))
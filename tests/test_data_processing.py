@@ -0,0 +1,34 @@
+import pandas as pd
+import pytest
+from bench import generate_race_results_csv, process_date_data_apply, process_duration_data_apply
+from config import config
+from dataset_store import read_athlete_race_results
+from data_processing import process_date_data, process_duration_data
+
+
+def read_csv_races(csv_filepath):
+    """ Read a race results .CSV file as the WebApp does """
+
+    return read_athlete_race_results({"name": "",
+                                      "csv_race_results_filepath": csv_filepath,
+                                      "gpx_race_route_filepath": config["gpx_race_route_filepath"]})
+
+
+@pytest.fixture(params=["race_results", "synthetic"])
+def csv_races(request, tmp_path):
+    """ Races of the .CSV file of the repository and of a synthetic .CSV file """
+
+    if request.param == "race_results":
+        return read_csv_races(config["csv_race_results_filepath"])
+    csv_filepath = str(tmp_path / "race_results.csv")
+    generate_race_results_csv(csv_filepath, 2000, seed=1)
+    return read_csv_races(csv_filepath)
+
+
+def test_process_date_data_matches_apply(csv_races):
+    pd.testing.assert_frame_equal(process_date_data(csv_races.copy()), process_date_data_apply(csv_races.copy()))
+
+
+def test_process_duration_data_matches_apply(csv_races):
+    pd.testing.assert_frame_equal(process_duration_data(csv_races.copy()),
+                                  process_duration_data_apply(csv_races.copy()))
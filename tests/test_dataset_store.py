@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+from config import config
+from dataset_store import read_race_results, load_processed_dataset
+
+
+def append_race(df, gpxfilename):
+    """ Return the races with a copy of the last one appended, pointing to the given .GPX file """
+
+    race = df.iloc[[-1]].copy()
+    race["gpxfilename"] = gpxfilename
+    race["gpx_filepath"] = config["gpx_race_route_filepath"] + gpxfilename
+    return pd.concat([df, race], ignore_index=True)
+
+
+def test_reload_unchanged_dataset():
+    df, route_store = load_processed_dataset(read_race_results())
+    stored_df, stored_route_store = load_processed_dataset(read_race_results())
+
+    pd.testing.assert_frame_equal(stored_df, df)
+    for race_id in df.index:
+        for field, column in route_store.race(race_id).items():
+            np.testing.assert_array_equal(stored_route_store.race(race_id)[field], column)
+
+
+def test_appended_race_with_missing_route_file():
+    """ A stored dataset to which only a race whose .GPX file cannot be loaded is added shall be loaded without it """
+
+    df, route_store = load_processed_dataset(read_race_results())
+    appended_df, appended_route_store = load_processed_dataset(append_race(read_race_results(), "missing.gpx"))
+
+    assert list(appended_df.attrs["route_errors"]) == [config["gpx_race_route_filepath"] + "missing.gpx"]
+    pd.testing.assert_frame_equal(appended_df.drop(columns=["row_fingerprint"]),
+                                  df.drop(columns=["row_fingerprint"]))
+    assert set(appended_route_store.columns) == set(route_store.columns)
+    assert appended_route_store.offsets[-1] == route_store.offsets[-1]
+
+
+def test_dataset_without_loadable_routes():
+    df = read_race_results()
+    df["gpx_filepath"] = config["gpx_race_route_filepath"] + "missing.gpx"
+
+    processed_df, route_store = load_processed_dataset(df)
+
+    assert processed_df.empty
+    assert "dist_accum_km" in route_store.columns
+    assert len(route_store.last_rows("dist_accum_km")) == 0
+
+
+def test_append_to_stored_dataset(tmp_path):
+    """ The added races shall be appended to the stored dataset as a new part, without leaving temporary folders
+    behind, and an unchanged dataset shall be returned without copying its stored routes """
+
+    load_processed_dataset(read_race_results())
+    df = read_race_results()
+    appended_df, appended_route_store = load_processed_dataset(append_race(df, df["gpxfilename"].iloc[0]))
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["processed_dataset", "route_cache"]
+    part_dirpaths = sorted((tmp_path / "processed_dataset").iterdir())
+    assert [path.name[:5] for path in part_dirpaths] == ["part_", "part_"]
+    assert len(pd.read_parquet(part_dirpaths[-1] / "races.parquet")) == 1
+    for column in appended_route_store.columns.values():
+        assert getattr(column, "_mmap", None) is None
+
+    stored_df, stored_route_store = load_processed_dataset(append_race(read_race_results(), df["gpxfilename"].iloc[0]))
+    assert len(stored_df) == len(appended_df) == len(df) + 1
+    pd.testing.assert_frame_equal(stored_df, appended_df)
+    for race_id in stored_df.index:
+        for field, column in appended_route_store.race(race_id).items():
+            np.testing.assert_array_equal(stored_route_store.race(race_id)[field], column)
+
+    unchanged_df, unchanged_route_store = load_processed_dataset(read_race_results())
+    unchanged_df, unchanged_route_store = load_processed_dataset(read_race_results())
+    assert len(list((tmp_path / "processed_dataset").iterdir())) == 2
+    for column in unchanged_route_store.columns.values():
+        assert isinstance(column, np.memmap)
+
+
+def test_merge_of_stored_dataset_parts(tmp_path):
+    """ The parts of the stored dataset shall be merged into a single one once they hold mostly removed races """
+
+    df = read_race_results()
+    load_processed_dataset(df.iloc[:1].copy())
+    load_processed_dataset(df.iloc[:2].copy())
+    load_processed_dataset(df.iloc[:3].copy())
+    assert len(list((tmp_path / "processed_dataset").iterdir())) == 3
+
+    merged_df, merged_route_store = load_processed_dataset(df.iloc[:1].copy())
+
+    part_dirpaths = list((tmp_path / "processed_dataset").iterdir())
+    assert len(part_dirpaths) == 1
+    assert len(pd.read_parquet(part_dirpaths[0] / "races.parquet")) == len(merged_df) == 1
+    stored_df, stored_route_store = load_processed_dataset(df.iloc[:1].copy())
+    pd.testing.assert_frame_equal(stored_df, merged_df)
+    np.testing.assert_array_equal(stored_route_store.offsets, merged_route_store.offsets)
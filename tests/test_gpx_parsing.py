@@ -0,0 +1,46 @@
+import glob
+import os
+import numpy as np
+import pytest
+from conftest import REPO_DIRPATH
+from data_processing import parse_gpx_file_iterparse, parse_gpx_file_gpxpy
+
+GPX_FILEPATHS = sorted(glob.glob(os.path.join(REPO_DIRPATH, "race_data", "*.gpx")))
+
+# Route whose second point has no elevation, for checking that both parsers return NaN for it
+GPX_WITHOUT_ELEVATION = """<?xml version="1.0" encoding="UTF-8"?>
+<gpx version="1.1" creator="test" xmlns="http://www.topografix.com/GPX/1/1">
+  <trk><trkseg>
+    <trkpt lat="41.4501" lon="2.2471"><ele>12.4</ele><time>2025-03-09T08:00:00Z</time></trkpt>
+    <trkpt lat="41.4503" lon="2.2474"><time>2025-03-09T08:00:05Z</time></trkpt>
+    <trkpt lat="41.4506" lon="2.2478"><ele>13.0</ele><time>2025-03-09T08:00:10.500Z</time></trkpt>
+  </trkseg></trk>
+</gpx>
+"""
+
+
+def assert_parsers_match(filepath):
+    """ Check that the streaming parser returns the same values (NaN being equal to NaN), with the same types, as
+    gpxpy """
+
+    iterparse_arrays = parse_gpx_file_iterparse(filepath)
+    gpxpy_arrays = parse_gpx_file_gpxpy(filepath)
+
+    assert len(iterparse_arrays) == len(gpxpy_arrays)
+    for name, iterparse_array, gpxpy_array in zip(["lat", "lon", "elev", "timestamp"], iterparse_arrays,
+                                                  gpxpy_arrays):
+        assert iterparse_array.dtype == gpxpy_array.dtype, name
+        np.testing.assert_array_equal(iterparse_array, gpxpy_array, err_msg=name)
+
+
+@pytest.mark.parametrize("filepath", GPX_FILEPATHS, ids=os.path.basename)
+def test_iterparse_matches_gpxpy(filepath):
+    assert_parsers_match(filepath)
+
+
+def test_iterparse_matches_gpxpy_without_elevation(tmp_path):
+    filepath = tmp_path / "route.gpx"
+    filepath.write_text(GPX_WITHOUT_ELEVATION, encoding="utf-8")
+
+    assert_parsers_match(str(filepath))
+    assert np.isnan(parse_gpx_file_iterparse(str(filepath))[2][1])
@@ -0,0 +1,51 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from memo_cache import MemoCache, SessionMemoCache
+
+
+def test_sessions_share_values_but_not_rerun_statistics():
+    cache = MemoCache(max_entries=8, max_size_bytes=1024 * 1024)
+    first_session = SessionMemoCache(cache)
+    second_session = SessionMemoCache(cache)
+
+    value = first_session.get_or_build("key", np.arange, 10)
+    assert second_session.get_or_build("key", np.arange, 10) is value
+
+    assert first_session.stats_rerun["misses"] == 1 and first_session.stats_rerun["hits"] == 0
+    assert second_session.stats_rerun["misses"] == 0 and second_session.stats_rerun["hits"] == 1
+    second_session.start_rerun()
+    assert second_session.stats_rerun["hits"] == 0
+    assert cache.stats_total["hits"] == 1 and cache.stats_total["misses"] == 1
+
+
+def test_concurrent_builds_keep_the_cache_consistent():
+    cache = MemoCache(max_entries=16, max_size_bytes=64 * 1024)
+
+    def build_values(session_idx):
+        session = SessionMemoCache(cache)
+        for idx in range(200):
+            session.get_or_build((idx + session_idx) % 40, np.zeros, 500)
+        return session.stats_rerun
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        sessions_stats = list(executor.map(build_values, range(8)))
+
+    assert len(cache.entries) <= cache.max_entries
+    assert cache.size_bytes == sum(size_bytes for _, size_bytes, _ in cache.entries.values())
+    assert cache.size_bytes <= cache.max_size_bytes
+    assert cache.stats_total["hits"] + cache.stats_total["misses"] == 8 * 200
+    assert sum(stats["hits"] for stats in sessions_stats) == cache.stats_total["hits"]
+
+
+def test_too_large_value_is_not_cached():
+    cache = MemoCache(max_entries=8, max_size_bytes=1024)
+    session = SessionMemoCache(cache)
+
+    session.get_or_build("small", np.zeros, 10)
+    session.get_or_build("large", np.zeros, 1000)
+    session.get_or_build("large", np.zeros, 1000)
+
+    assert list(cache.entries) == ["small"]
+    assert session.stats_rerun["too_large"] == 2 and session.stats_rerun["misses"] == 3
+    cache.clear()
+    assert not cache.entries and cache.size_bytes == 0
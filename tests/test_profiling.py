@@ -0,0 +1,34 @@
+import threading
+from profiling import Profiler, profiled, current_profiler
+
+
+@profiled
+def profiled_stage(value):
+    return value
+
+
+def test_each_context_records_into_its_own_profiler():
+    profilers = [Profiler(True, False, 5, None) for _ in range(4)]
+    barrier = threading.Barrier(len(profilers))
+
+    def run_rerun(profiler, stages_count):
+        current_profiler.set(profiler)
+        profiler.start_rerun()
+        barrier.wait()
+        for idx in range(stages_count):
+            profiled_stage(idx)
+        profiler.end_rerun()
+
+    threads = [threading.Thread(target=run_rerun, args=(profiler, idx + 1)) for idx, profiler in enumerate(profilers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for idx, profiler in enumerate(profilers):
+        assert [record["stage"] for record in profiler.history[-1]["records"]] == ["profiled_stage"] * (idx + 1)
+
+
+def test_disabled_profiler_by_default():
+    assert not current_profiler.get().enabled
+    assert profiled_stage(3) == 3
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+from race_aggregation import aggregate_time_per_km, count_races_per_distance
+
+
+def test_aggregate_time_per_km_per_athlete():
+    df = pd.DataFrame({"date": pd.to_datetime(["2025-01-05", "2025-01-20", "2025-01-25", "2025-02-02", "2025-01-10"]),
+                       "distance": [5, 5, 10, 5, 5],
+                       "duration_km_sec": [300.0, 310.0, 330.0, 305.0, 400.0],
+                       "athlete": ["A", "A", "A", "A", "B"]})
+
+    aggregates = aggregate_time_per_km(df, "All", "Month")
+
+    assert aggregates[["athlete", "period_start", "count"]].to_dict("list") == {
+        "athlete": ["A", "A", "B"],
+        "period_start": list(pd.to_datetime(["2025-01-01", "2025-02-01", "2025-01-01"])),
+        "count": [3, 1, 1]}
+    january = aggregates.iloc[0]
+    assert (january["min"], january["max"]) == (300.0, 330.0)
+    assert january["median"] == np.median([300.0, 310.0, 330.0])
+    assert january["p25"] == np.quantile([300.0, 310.0, 330.0], 0.25)
+    assert aggregates.iloc[2]["median"] == 400.0
+
+
+def test_count_races_per_distance_bucket():
+    df = pd.DataFrame({"distance": [5, 5.02, 6, 10, 10.1, 21.0975, 42.195, 5],
+                       "athlete": ["A", "A", "A", "B", "A", "A", "B", "B"]})
+
+    distance_counts = count_races_per_distance(df)
+
+    assert distance_counts.to_dict("list") == {"distance_start_km": [5.0, 5.0, 6.0, 10.0, 10.0, 21.0, 42.0],
+                                               "distance_end_km": [6.0, 6.0, 7.0, 11.0, 11.0, 22.0, 43.0],
+                                               "athlete": ["A", "B", "A", "A", "B", "A", "B"],
+                                               "races_count": [2, 1, 1, 1, 1, 1, 1]}
+    assert distance_counts["races_count"].sum() == len(df)
@@ -0,0 +1,56 @@
+import glob
+import os
+import shutil
+import numpy as np
+import pytest
+import data_processing
+from data_processing import load_routes
+
+
+def test_warm_start_does_not_hash_unchanged_files(tmp_path, monkeypatch):
+    gpx_dirpath = tmp_path / "race_data"
+    shutil.copytree("race_data", gpx_dirpath)
+    filepaths = sorted(glob.glob(str(gpx_dirpath / "*.gpx")))
+    cold_routes = load_routes(filepaths)
+
+    hashed_filepaths = []
+    get_file_content_hash = data_processing.get_file_content_hash
+
+    def get_file_content_hash_counted(filepath):
+        hashed_filepaths.append(filepath)
+        return get_file_content_hash(filepath)
+
+    monkeypatch.setattr(data_processing, "get_file_content_hash", get_file_content_hash_counted)
+    warm_routes = load_routes(filepaths)
+    assert hashed_filepaths == []
+    assert [track_id for track_id, _, _ in warm_routes] == [track_id for track_id, _, _ in cold_routes]
+    for (_, cold_route, _), (_, warm_route, _) in zip(cold_routes, warm_routes):
+        np.testing.assert_array_equal(warm_route, cold_route)
+
+    # A changed file is hashed again
+    os.utime(filepaths[0], ns=(0, 0))
+    load_routes(filepaths)
+    assert hashed_filepaths == [filepaths[0]]
+
+
+GPX_ROUTE = """<?xml version="1.0" encoding="UTF-8"?>
+<gpx version="1.1" creator="test" xmlns="http://www.topografix.com/GPX/1/1">
+  <trk><trkseg>
+{points}
+  </trkseg></trk>
+</gpx>
+"""
+GPX_POINT = '    <trkpt lat="{lat}" lon="2.2471"><ele>12.4</ele><time>2025-03-09T08:00:{second:02d}Z</time></trkpt>'
+
+
+@pytest.mark.parametrize("lats", [[41.4501], [41.4501, 41.4501, 41.4501]], ids=["one_point", "zero_distance"])
+def test_degenerate_route_is_reported(tmp_path, lats):
+    filepath = tmp_path / "route.gpx"
+    filepath.write_text(GPX_ROUTE.format(points="\n".join(GPX_POINT.format(lat=lat, second=idx)
+                                                          for idx, lat in enumerate(lats))), encoding="utf-8")
+    valid_filepath = sorted(glob.glob("race_data/*.gpx"))[0]
+
+    routes = load_routes([str(filepath), valid_filepath])
+
+    assert routes[0][1] is None and routes[0][2].startswith("ValueError")
+    assert routes[1][1] is not None and routes[1][2] is None
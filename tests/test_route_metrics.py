@@ -0,0 +1,60 @@
+import glob
+import os
+from datetime import datetime, timedelta, timezone
+import gpxpy
+import haversine
+import numpy as np
+import pytest
+from conftest import REPO_DIRPATH
+from data_processing import compute_route_metrics
+
+GPX_FILEPATHS = sorted(glob.glob(os.path.join(REPO_DIRPATH, "race_data", "*.gpx")))
+
+
+def compute_route_metrics_per_point(lat, lon, timestamp):
+    """ Calculate the step and cumulative distance and duration point by point, as before the vectorization """
+
+    dist_step_km = [0]
+    duration_step_sec = [0]
+    for idx_point in range(1, len(lat)):
+        dist_step_km.append(haversine.haversine((lat[idx_point - 1], lon[idx_point - 1]),
+                                                (lat[idx_point], lon[idx_point])))
+        duration_step_sec.append((timestamp[idx_point] - timestamp[idx_point - 1]).seconds)
+
+    return {"dist_step_km": np.array(dist_step_km),
+            "dist_accum_km": np.cumsum(dist_step_km),
+            "duration_step_sec": np.array(duration_step_sec),
+            "duration_accum_sec": np.cumsum(duration_step_sec)}
+
+
+def assert_metrics_match(lat, lon, timestamp):
+    metrics = compute_route_metrics(lat, lon, timestamp)
+    reference = compute_route_metrics_per_point(lat, lon, timestamp)
+
+    np.testing.assert_allclose(metrics["dist_step_km"], reference["dist_step_km"], rtol=1e-12)
+    np.testing.assert_allclose(metrics["dist_accum_km"], reference["dist_accum_km"], rtol=1e-12)
+    np.testing.assert_array_equal(metrics["duration_step_sec"], reference["duration_step_sec"])
+    np.testing.assert_array_equal(metrics["duration_accum_sec"], reference["duration_accum_sec"])
+
+
+@pytest.mark.parametrize("filepath", GPX_FILEPATHS, ids=os.path.basename)
+def test_metrics_match_per_point_reference(filepath):
+    with open(filepath, "r") as gpx_file:
+        points = [point for track in gpxpy.parse(gpx_file).tracks for segment in track.segments
+                  for point in segment.points]
+
+    assert_metrics_match([point.latitude for point in points], [point.longitude for point in points],
+                         [point.time for point in points])
+
+
+def test_metrics_match_per_point_reference_with_irregular_timestamps():
+    """ Negative and sub-second steps are wrapped to the [0, 1 day) interval and truncated to whole seconds, as
+    timedelta.seconds does """
+
+    start = datetime(2025, 3, 9, 8, 0, tzinfo=timezone.utc)
+    steps_sec = [0, 1, 0.4, 0.7, -2, -0.3, 5.999, 3600, -86400.5, 90000]
+    timestamp = list(start + np.cumsum([timedelta(seconds=step_sec) for step_sec in steps_sec]))
+    lat = 41.45 + np.arange(len(steps_sec)) * 1e-4
+    lon = 2.25 + np.arange(len(steps_sec)) * 2e-4
+
+    assert_metrics_match(lat, lon, timestamp)
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+from dataset_store import read_race_results, load_processed_dataset
+from data_processing import compute_splits, SPLIT_LENGTHS_KM
+from route_store import RouteStore
+
+
+@pytest.fixture(scope="module")
+def route_store():
+    _, route_store = load_processed_dataset(read_race_results())
+    return route_store
+
+
+@pytest.mark.parametrize("split_length_km", SPLIT_LENGTHS_KM.values(), ids=SPLIT_LENGTHS_KM.keys())
+def test_splits_sum_up_to_route(route_store, split_length_km):
+    splits = compute_splits(route_store, split_length_km)
+
+    for race_id in route_store.race_ids:
+        race_splits = splits.race(race_id)
+        race_route = route_store.race(race_id)
+        assert race_splits["split_duration_sec"].sum() == pytest.approx(race_route["duration_accum_sec"][-1])
+        assert race_splits["pace_dist_km"].sum() == pytest.approx(race_route["dist_accum_km"][-1])
+
+
+def test_splits_with_standing_still_points():
+    """ The time spent standing still (same distance for several points) at the start, at a split mark and at the end
+    is part of the split which follows it, or of the last split """
+
+    routes = [{"dist_accum_km": np.array([0, 0, 0, 0.5, 1, 1, 1.5, 2, 2]),
+               "duration_accum_sec": np.array([0, 10, 20, 170, 320, 340, 490, 640, 700])},
+              {"dist_accum_km": np.array([0, 1, 2]),
+               "duration_accum_sec": np.array([0, 300, 600])}]
+    splits = compute_splits(RouteStore.from_arrays(["A", "B"], routes, fields=["dist_accum_km", "duration_accum_sec"]),
+                            1.0)
+
+    np.testing.assert_array_equal(splits.race("A")["split_duration_sec"], [320, 380])
+    np.testing.assert_array_equal(splits.race("B")["split_duration_sec"], [300, 300])